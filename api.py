@@ -0,0 +1,214 @@
+from datetime import date, datetime, timedelta
+from flask import Blueprint, Response, abort, request
+from flask import stream_with_context
+from models import LISTING_FIELDS, request_now, Artist, Genre, Show, Venue, \
+    VenueArea
+from replicas import replica_reads
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    import json
+
+# ----------------------------------------------------------------------------#
+# Read-only JSON API.
+# ----------------------------------------------------------------------------#
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+VENUE_FIELDS = frozenset([
+    "id", "name", "address", "city", "state", "phone", "website",
+    "facebook_link", "image_link", "seeking_talent", "seeking_description",
+    "genres", "upcoming_shows_count", "upcoming_shows", "past_shows_count",
+    "past_shows", "version"
+])
+ARTIST_FIELDS = frozenset([
+    "id", "name", "city", "state", "phone", "website", "facebook_link",
+    "image_link", "seeking_venue", "seeking_description", "genres",
+    "upcoming_shows_count", "upcoming_shows", "past_shows_count",
+    "past_shows", "version"
+])
+
+# Length of a calendar window in days, when `to` is not given, and at most.
+CALENDAR_DAYS = 31
+CALENDAR_MAX_DAYS = 366
+
+
+def _default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError("Cannot serialize {!r}".format(value))
+
+
+def dumps(value):
+    """Serialize `value` to JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, default=_default,
+                      separators=(",", ":")).encode()
+
+
+def json_response(value, status=200):
+    return Response(dumps(value), status=status,
+                    mimetype='application/json')
+
+
+def selected_fields(allowed, default=None):
+    """Parse the comma separated `fields` query argument. Returns `default`
+    when it is absent and rejects fields outside `allowed` with a 400."""
+    fields = request.args.get('fields')
+    if not fields:
+        return default
+    fields = tuple(field.strip() for field in fields.split(',')
+                   if field.strip())
+    unknown = set(fields) - set(allowed)
+    if unknown:
+        abort(json_response(
+            {"error": "Unknown fields: " + ", ".join(sorted(unknown))}, 400))
+    return fields
+
+
+def selected_genre():
+    """Resolve the `genre` query argument to a genre id. Returns None when
+    it is absent and rejects unknown genres with a 404."""
+    name = request.args.get('genre')
+    if not name:
+        return None
+    genre_id = Genre.id_of(name)
+    if genre_id is None:
+        abort(json_response({"error": "Genre not found"}, 404))
+    return genre_id
+
+
+def selected_window():
+    """Parse the `from` and `to` query arguments, ISO dates or times, into
+    the [from, to) window of a calendar. `from` defaults to the start of
+    today and `to` to CALENDAR_DAYS after `from`; empty windows and windows
+    longer than CALENDAR_MAX_DAYS are rejected with a 400."""
+    try:
+        start = request.args.get('from')
+        start = datetime.fromisoformat(start) if start else \
+            request_now().replace(hour=0, minute=0, second=0, microsecond=0)
+        end = request.args.get('to')
+        end = datetime.fromisoformat(end) if end else \
+            start + timedelta(days=CALENDAR_DAYS)
+    except ValueError:
+        abort(json_response({"error": "Invalid date"}, 400))
+    if not start < end <= start + timedelta(days=CALENDAR_MAX_DAYS):
+        abort(json_response({"error": "The window must end after it starts "
+                             "and span at most {} days".format(
+                                 CALENDAR_MAX_DAYS)}, 400))
+    return start, end
+
+
+def stream_list(rows):
+    """Stream an iterable of JSON-serializable rows as one JSON array,
+    without holding the whole array in memory."""
+    def generate():
+        yield b"["
+        for n, row in enumerate(rows):
+            yield (b"," if n else b"") + dumps(row)
+        yield b"]"
+    return Response(stream_with_context(generate()),
+                    mimetype='application/json')
+
+
+#  Venues
+#  ----------------------------------------------------------------
+
+@api.route('/venues')
+@replica_reads
+def venues():
+    fields = selected_fields(LISTING_FIELDS["Venue"],
+                             LISTING_FIELDS["Venue"])
+    return stream_list(Venue.listing(fields, selected_genre()))
+
+
+@api.route('/venues/search')
+@replica_reads
+def search_venues():
+    return json_response(Venue.search(request.args.get('q', ''),
+                                      selected_genre()))
+
+
+@api.route('/venues/<int:venue_id>')
+@replica_reads
+def venue(venue_id):
+    data = Venue.find(venue_id, selected_fields(VENUE_FIELDS))
+    if data is None:
+        return json_response({"error": "Venue not found"}, 404)
+    return json_response(data)
+
+
+@api.route('/venues/<int:venue_id>/calendar')
+@replica_reads
+def venue_calendar(venue_id):
+    data = Venue.calendar(venue_id, *selected_window())
+    if data is None:
+        return json_response({"error": "Venue not found"}, 404)
+    return json_response(data)
+
+
+@api.route('/cities/<state>/<city>/calendar')
+@replica_reads
+def city_calendar(state, city):
+    data = VenueArea.calendar(state, city, *selected_window())
+    if data is None:
+        return json_response({"error": "City not found"}, 404)
+    return json_response(data)
+
+
+#  Artists
+#  ----------------------------------------------------------------
+
+@api.route('/artists')
+@replica_reads
+def artists():
+    fields = selected_fields(LISTING_FIELDS["Artist"],
+                             LISTING_FIELDS["Artist"])
+    return stream_list(Artist.listing(fields, selected_genre()))
+
+
+@api.route('/artists/search')
+@replica_reads
+def search_artists():
+    return json_response(Artist.search(request.args.get('q', ''),
+                                       selected_genre()))
+
+
+@api.route('/artists/<int:artist_id>')
+@replica_reads
+def artist(artist_id):
+    data = Artist.find(artist_id, selected_fields(ARTIST_FIELDS))
+    if data is None:
+        return json_response({"error": "Artist not found"}, 404)
+    return json_response(data)
+
+
+@api.route('/artists/<int:artist_id>/calendar')
+@replica_reads
+def artist_calendar(artist_id):
+    data = Artist.calendar(artist_id, *selected_window())
+    if data is None:
+        return json_response({"error": "Artist not found"}, 404)
+    return json_response(data)
+
+
+#  Shows
+#  ----------------------------------------------------------------
+
+@api.route('/shows')
+@replica_reads
+def shows():
+    fields = selected_fields(LISTING_FIELDS["Show"], LISTING_FIELDS["Show"])
+    return stream_list(Show.listing(fields))
+
+
+#  Genres
+#  ----------------------------------------------------------------
+
+@api.route('/genres')
+@replica_reads
+def genres():
+    return json_response(Genre.listing())
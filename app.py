@@ -4,49 +4,110 @@
 
 import dateutil.parser
 import babel
-from flask import Flask, abort, render_template, request, Response
-from flask import flash, redirect, url_for
+import click
+from datetime import datetime, timedelta
+from functools import lru_cache
+from flask import Blueprint, Flask, abort, current_app, jsonify, \
+    render_template, request, Response
+from flask import flash, redirect, stream_with_context, url_for
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 import logging
 from logging import Formatter, FileHandler
 from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+from sqlalchemy.orm.exc import StaleDataError
 from forms import VenueForm, ArtistForm, ShowForm
 from flask_migrate import Migrate
-from models import Show, Artist, Venue
+from models import db, BookingConflict, Show, Artist, Venue
+from api import api
+from assets import asset_pipeline, build_assets
+from plancheck import check_plans
+from cache import cached_page, page_cache
+from metrics import query_metrics
+from replicas import read_replicas, replica_reads
+from datagen import DatasetGenerator
+from importer import Importer, read_records
+from partitions import archive_show_partitions, create_show_partitions
 
 # ----------------------------------------------------------------------------#
 # App Config.
 # ----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+moment = Moment()
+migrate = Migrate()
+main = Blueprint('main', __name__, cli_group=None)
+
+
+def create_app(config='config'):
+    """Build the application. Every module shares the `db` of models.py, so
+    the app has a single primary engine and connection pool, tuned by the
+    SQLALCHEMY_ENGINE_OPTIONS of `config`, plus one per read replica."""
+    app = Flask(__name__)
+    app.config.from_object(config)
+    db.init_app(app)
+    migrate.init_app(app, db)
+    moment.init_app(app)
+    page_cache.init_app(app)
+    query_metrics.init_app(app)
+    read_replicas.init_app(app)
+    asset_pipeline.init_app(app)
+    app.jinja_env.filters['datetime'] = format_datetime
+    app.register_blueprint(main)
+    app.register_blueprint(api)
+
+    if not app.debug:
+        file_handler = FileHandler('error.log')
+        file_handler.setFormatter(
+            Formatter(
+                '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+        )
+        app.logger.setLevel(logging.INFO)
+        file_handler.setLevel(logging.INFO)
+        app.logger.addHandler(file_handler)
+        app.logger.info('errors')
+
+    return app
 
 # ----------------------------------------------------------------------------#
 # Filters.
 # ----------------------------------------------------------------------------#
 
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
 
 
-app.jinja_env.filters['datetime'] = format_datetime
+@lru_cache(maxsize=None)
+def datetime_formatter(format='medium', locale=None):
+    """Return a function formatting datetimes with `format`, a name from
+    DATETIME_FORMATS or a Babel pattern. The pattern and locale are
+    resolved once per (format, locale) pair instead of on every call."""
+    pattern = babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format))
+    locale = babel.Locale.parse(locale or babel.dates.LC_TIME)
+    return lambda value: pattern.apply(value, locale)
+
+
+def format_datetime(value, format='medium', locale=None):
+    if isinstance(value, str):
+        value = dateutil.parser.parse(value)
+    return datetime_formatter(format, locale)(value)
+
+
+def stream_template(template_name, **context):
+    """Render a template as a stream of chunks that are sent to the client
+    while the rest of the page, and the data it loops over, is produced."""
+    current_app.update_template_context(context)
+    stream = current_app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(current_app.config['STREAM_BUFFER_SIZE'])
+    return Response(stream_with_context(stream))
 
 
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
 
-@app.route('/')
+@main.route('/')
 def index():
     return render_template('pages/home.html')
 
@@ -54,16 +115,24 @@ def index():
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@main.route('/venues')
+@cached_page('Venue', 'Show')
+@replica_reads
 def venues():
     try:
+        if current_app.config['STREAM_LISTINGS']:
+            return stream_template(
+                'pages/venues.html',
+                areas=Venue.streamByLocation(
+                    current_app.config['STREAM_BATCH_SIZE']))
         data = Venue.byLocation()
         return render_template('pages/venues.html', areas=data)
     except DBAPIError:
         return render_template('errors/500.html')
 
 
-@app.route('/venues/search', methods=['POST'])
+@main.route('/venues/search', methods=['POST'])
+@replica_reads
 def search_venues():
     try:
         response = Venue.search(request.form.get("search_term"))
@@ -73,26 +142,27 @@ def search_venues():
         return render_template("errors/500.html")
 
 
-@app.route('/venues/<int:venue_id>')
+@main.route('/venues/<int:venue_id>')
+@cached_page('Venue', 'VenueGenre', 'Show', 'Artist')
+@replica_reads
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
-    try:
-        data = Venue.query.get(venue_id).details
-        return render_template('pages/show_venue.html', venue=data)
-    except AttributeError:
+    data = Venue.find(venue_id)
+    if data is None:
         return abort(404)
+    return render_template('pages/show_venue.html', venue=data)
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
 
-@app.route('/venues/create', methods=['GET'])
+@main.route('/venues/create', methods=['GET'])
 def create_venue_form():
     form = VenueForm()
     return render_template('forms/new_venue.html', form=form)
 
 
-@app.route('/venues/create', methods=['POST'])
+@main.route('/venues/create', methods=['POST'])
 def create_venue_submission():
     form = VenueForm(request.form)
     try:
@@ -105,11 +175,13 @@ def create_venue_submission():
     return render_template('pages/home.html')
 
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@main.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
     try:
-        Venue.delete(venue_id)
+        deleted = Venue.delete(venue_id)
     except (DBAPIError, SQLAlchemyError):
+        abort(500)
+    if not deleted:
         abort(404)
 
     return Response(status=200)
@@ -118,13 +190,24 @@ def delete_venue(venue_id):
 #  ----------------------------------------------------------------
 
 
-@app.route('/artists')
+@main.route('/artists')
+@cached_page('Artist')
+@replica_reads
 def artists():
-    data = Artist.query.all()
-    return render_template('pages/artists.html', artists=data)
-
-
-@app.route('/artists/search', methods=['POST'])
+    try:
+        data = Artist.page(after=request.args.get('after'),
+                           before=request.args.get('before'),
+                           letter=request.args.get('letter'),
+                           per_page=current_app.config['ARTISTS_PER_PAGE'])
+    except ValueError:
+        return abort(400)
+    return render_template('pages/artists.html', artists=data["artists"],
+                           prev_cursor=data["prev_cursor"],
+                           next_cursor=data["next_cursor"])
+
+
+@main.route('/artists/search', methods=['POST'])
+@replica_reads
 def search_artists():
     try:
         response = Artist.search(request.form.get("search_term"))
@@ -134,20 +217,21 @@ def search_artists():
         return render_template("errors/500.html")
 
 
-@app.route('/artists/<int:artist_id>')
+@main.route('/artists/<int:artist_id>')
+@cached_page('Artist', 'ArtistGenre', 'Show', 'Venue')
+@replica_reads
 def show_artist(artist_id):
-    # shows the venue page with the given venue_id
-    try:
-        data = Artist.query.get(artist_id).details
-        return render_template('pages/show_artist.html', artist=data)
-    except AttributeError:
+    # shows the artist page with the given artist_id
+    data = Artist.find(artist_id)
+    if data is None:
         return abort(404)
+    return render_template('pages/show_artist.html', artist=data)
 
 #  Update
 #  ----------------------------------------------------------------
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@main.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
     artist = Artist.find(artist_id)
     if artist is None:
@@ -157,14 +241,25 @@ def edit_artist(artist_id):
         return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@main.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
     form = ArtistForm(request.form)
-    Artist.update(artist_id, form)
-    return redirect(url_for('show_artist', artist_id=artist_id))
+    try:
+        if not Artist.update(artist_id, form):
+            return abort(404)
+    except ValueError:
+        return abort(400)
+    except StaleDataError:
+        flash('Artist ' + form.name.data + ' was changed by someone else '
+              'while you were editing it. Review the changes and try again.')
+        return redirect(url_for('main.edit_artist', artist_id=artist_id))
+    except (DBAPIError, SQLAlchemyError):
+        flash('An error occurred. Artist ' + form.name.data +
+              ' could not be updated.')
+    return redirect(url_for('main.show_artist', artist_id=artist_id))
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@main.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
     form = VenueForm()
     venue = Venue.find(venue_id)
@@ -175,24 +270,35 @@ def edit_venue(venue_id):
         return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@main.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
     form = VenueForm(request.form)
-    Venue.update(venue_id, form)
-    return redirect(url_for('show_venue', venue_id=venue_id))
+    try:
+        if not Venue.update(venue_id, form):
+            return abort(404)
+    except ValueError:
+        return abort(400)
+    except StaleDataError:
+        flash('Venue ' + form.name.data + ' was changed by someone else '
+              'while you were editing it. Review the changes and try again.')
+        return redirect(url_for('main.edit_venue', venue_id=venue_id))
+    except (DBAPIError, SQLAlchemyError):
+        flash('An error occurred. Venue ' + form.name.data +
+              ' could not be updated.')
+    return redirect(url_for('main.show_venue', venue_id=venue_id))
 
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
 
-@app.route('/artists/create', methods=['GET'])
+@main.route('/artists/create', methods=['GET'])
 def create_artist_form():
     form = ArtistForm()
     return render_template('forms/new_artist.html', form=form)
 
 
-@app.route('/artists/create', methods=['POST'])
+@main.route('/artists/create', methods=['POST'])
 def create_artist_submission():
     form = ArtistForm(request.form)
     try:
@@ -205,11 +311,13 @@ def create_artist_submission():
     return render_template('pages/home.html')
 
 
-@app.route('/artists/<artist_id>', methods=['DELETE'])
+@main.route('/artists/<int:artist_id>', methods=['DELETE'])
 def delete_artist(artist_id):
     try:
-        Artist.delete(artist_id)
+        deleted = Artist.delete(artist_id)
     except (DBAPIError, SQLAlchemyError):
+        abort(500)
+    if not deleted:
         abort(404)
 
     return Response(status=200)
@@ -218,39 +326,49 @@ def delete_artist(artist_id):
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+@main.route('/shows')
+@cached_page('Show', 'Artist', 'Venue')
+@replica_reads
 def shows():
-    # displays list of shows at /shows
+    # displays list of shows at /shows, one keyset page at a time unless
+    # the whole listing is streamed
+    if current_app.config['STREAM_LISTINGS']:
+        return stream_template(
+            'pages/shows.html',
+            shows=Show.stream(current_app.config['STREAM_BATCH_SIZE']))
     try:
-        data = [show.details for show in Show.query.all()]
-        return render_template('pages/shows.html', shows=data)
-    except AttributeError:
-        return abort(404)
+        data = Show.page(after=request.args.get('after'),
+                         before=request.args.get('before'),
+                         per_page=current_app.config['SHOWS_PER_PAGE'])
+    except ValueError:
+        return abort(400)
+    return render_template('pages/shows.html', shows=data["shows"],
+                           prev_cursor=data["prev_cursor"],
+                           next_cursor=data["next_cursor"])
 
 
-@app.route('/shows/create')
+@main.route('/shows/create')
 def create_shows():
     # renders form. do not touch.
     form = ShowForm()
     return render_template('forms/new_show.html', form=form)
 
 
-@app.route('/shows/create', methods=['POST'])
+@main.route('/shows/create', methods=['POST'])
 def create_show_submission():
     # called to create new shows in the db, upon submitting new show form
     form = ShowForm(request.form)
     try:
-        venue_id = form.venue_id.data
-        artist_id = form.artist_id.data
-        start_time = form.start_time.data
-
-        show = Show(venue_id=venue_id, artist_id=artist_id,
-                    start_time=start_time)
-        db.session.add(show)
-        db.session.commit()
-
+        Show.create(form)
         flash('Show was successfully listed!')
-    except DBAPIError:
+    except BookingConflict as e:
+        flash('Show could not be listed: ' + str(e) + '.')
+        return render_template('forms/new_show.html', form=form)
+    except ValueError:
+        flash('Show could not be listed. Check the artist and venue IDs, '
+              'the start time and the duration.')
+        return render_template('forms/new_show.html', form=form)
+    except (DBAPIError, SQLAlchemyError):
         flash('An error occurred. Show could not be listed.')
     finally:
         db.session.close()
@@ -258,38 +376,106 @@ def create_show_submission():
     return render_template('pages/home.html')
 
 
-@app.errorhandler(404)
+#  Maintenance
+#  ----------------------------------------------------------------
+
+@main.route('/cache/stats')
+def cache_stats():
+    return jsonify(page_cache.stats())
+
+
+@main.cli.command('rollover-shows')
+@click.option('--hours', default=25, show_default=True,
+              help='Look back this many hours for shows that have started.')
+def rollover_shows(hours):
+    """Move started shows from the upcoming to the past show counters."""
+    Show.rollover(datetime.now() - timedelta(hours=hours))
+
+
+@main.cli.command('seed')
+@click.option('--artists', default=1000, show_default=True)
+@click.option('--venues', default=200, show_default=True)
+@click.option('--shows', default=20000, show_default=True)
+@click.option('--seed', default=42, show_default=True,
+              help='Random seed; the same seed gives the same dataset.')
+@click.option('--batch-size', default=10000, show_default=True)
+def seed(artists, venues, shows, seed, batch_size):
+    """Add a synthetic dataset of the given size to the database."""
+    DatasetGenerator(artists, venues, shows, seed, batch_size).run(click.echo)
+
+
+@main.cli.command('import-data')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('file', type=click.File(encoding='utf-8'))
+@click.option('--format', type=click.Choice(['csv', 'jsonl']),
+              help='File format; guessed from the extension by default.')
+@click.option('--batch-size', default=1000, show_default=True)
+def import_data(kind, file, format, batch_size):
+    """Bulk import venues, artists or shows from a CSV or JSONL file."""
+    inserted, skipped = Importer(batch_size, click.echo).run(
+        kind, read_records(file, format))
+    click.echo('Imported {} {}, skipped {}.'.format(inserted, kind, skipped))
+
+
+@main.cli.command('partition-shows')
+@click.option('--ahead', default=12, show_default=True,
+              help='Months after the current one to create partitions for.')
+@click.option('--archive-after', type=int,
+              help='Detach the partitions of shows older than this many '
+                   'months.')
+def partition_shows(ahead, archive_after):
+    """Create upcoming monthly Show partitions and archive old ones
+    (Postgres only)."""
+    for name in create_show_partitions(ahead):
+        click.echo('Created {}.'.format(name))
+    if archive_after is not None:
+        for name in archive_show_partitions(archive_after):
+            click.echo('Archived {}.'.format(name))
+
+
+@main.cli.command('build-assets')
+def build_assets_command():
+    """Bundle, minify, fingerprint and precompress the static assets."""
+    for name, filename in sorted(build_assets(
+            current_app.static_folder).items()):
+        click.echo('{} -> {}'.format(name, filename))
+
+
+@main.cli.command('check-plans')
+@click.option('--min-rows', default=10000, show_default=True,
+              help='Ignore sequential scans of tables smaller than this.')
+def check_plans_command(min_rows):
+    """Fail if a model query sequentially scans a large table."""
+    failures = check_plans(min_rows)
+    for label, relation, statement in failures:
+        click.echo('{}: sequential scan of "{}" in\n{}\n'.format(
+            label, relation, statement))
+    if failures:
+        raise SystemExit(1)
+    click.echo('No sequential scans of large tables.')
+
+
+@main.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
 
-@app.errorhandler(500)
+@main.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
-
 # ----------------------------------------------------------------------------#
 # Launch.
 # ----------------------------------------------------------------------------#
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
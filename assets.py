@@ -0,0 +1,210 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import threading
+from flask import Blueprint, abort, current_app, request, \
+    send_from_directory, url_for
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+# ----------------------------------------------------------------------------#
+# Static assets.
+# ----------------------------------------------------------------------------#
+
+# Bundles, as name: files under static/ concatenated in that order.
+BUNDLES = {
+    "main.css": ["css/bootstrap.min.css", "css/layout.main.css",
+                 "css/main.css", "css/main.responsive.css",
+                 "css/main.quickfix.css"],
+    # Loaded in <head>, before the page renders.
+    "head.js": ["js/libs/modernizr-2.8.2.min.js", "js/libs/moment.min.js"],
+    # Deferred, so it runs once the page is parsed.
+    "main.js": ["js/libs/jquery-1.11.1.min.js",
+                "js/libs/bootstrap-3.1.1.min.js", "js/plugins.js",
+                "js/script.js"],
+}
+
+# Files that are fingerprinted on their own.
+FILES = ["js/libs/respond-1.4.2.min.js", "img/front-splash.jpg"]
+
+# Builds go to static/dist, at the same depth as static/css so that the
+# relative url()s of the stylesheets still resolve.
+BUILD_DIR = "dist"
+MANIFEST = "manifest.json"
+
+# Extensions of the assets that get precompressed variants.
+COMPRESSED = frozenset([".css", ".js"])
+
+# Accept-Encoding token and file suffix of each variant, by preference.
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# Names of the builds, as written by write_asset().
+HASHED_NAME = re.compile(r"^[^/]+\.[0-9a-f]{16}\.[^./]+$")
+
+# Builds never change under their name, so clients may keep them for good.
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def minify(name, text):
+    """Minify CSS or JS when rcssmin or rjsmin is installed."""
+    if name.endswith(".css") and rcssmin is not None:
+        return rcssmin.cssmin(text)
+    if name.endswith(".js") and rjsmin is not None:
+        return rjsmin.jsmin(text, keep_bang_comments=True)
+    return text
+
+
+def _write(path, content):
+    temporary = "{}.{}.tmp".format(path, os.getpid())
+    with open(temporary, "wb") as f:
+        f.write(content)
+    os.replace(temporary, path)
+
+
+def write_asset(directory, name, content):
+    """Write `content` to `directory` as `name` with its content hash
+    inserted before the extension, plus .gz and .br variants of text
+    assets. Returns the hashed file name."""
+    stem, extension = os.path.splitext(name)
+    filename = "{}.{}{}".format(
+        stem, hashlib.sha256(content).hexdigest()[:16], extension)
+    path = os.path.join(directory, filename)
+    if os.path.exists(path):
+        return filename
+    _write(path, content)
+    if extension in COMPRESSED:
+        _write(path + ".gz", gzip.compress(content, 9, mtime=0))
+        if brotli is not None:
+            _write(path + ".br", brotli.compress(content))
+    return filename
+
+
+def build_assets(static_folder):
+    """Build the BUNDLES and FILES into static/dist and write the manifest
+    mapping their names to the hashed files. Returns the manifest.
+
+    Builds of earlier versions are kept, so that pages rendered before a
+    deploy, e.g. from the page cache, keep working.
+    """
+    directory = os.path.join(static_folder, BUILD_DIR)
+    os.makedirs(directory, exist_ok=True)
+    manifest = {}
+    for name, sources in BUNDLES.items():
+        parts = []
+        for source in sources:
+            with open(os.path.join(static_folder, source),
+                      encoding="utf-8") as f:
+                parts.append(minify(name, f.read()))
+        # A statement left open by one script must not run into the next.
+        separator = ";\n" if name.endswith(".js") else "\n"
+        manifest[name] = write_asset(
+            directory, name, separator.join(parts).encode())
+    for source in FILES:
+        with open(os.path.join(static_folder, source), "rb") as f:
+            manifest[source] = write_asset(
+                directory, os.path.basename(source), f.read())
+    _write(os.path.join(directory, MANIFEST),
+           json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+class AssetPipeline:
+    """The manifest of the built assets, for asset_url().
+
+    It is read from static/dist on first use, and the assets are built if
+    `flask build-assets` has not been run. In debug mode they are rebuilt
+    whenever a source file changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.extensions["asset_manifest"] = None
+        app.register_blueprint(assets)
+        app.add_template_global(asset_url)
+
+    def manifest(self):
+        app = current_app._get_current_object()
+        manifest = app.extensions["asset_manifest"]
+        if manifest is not None and not app.debug:
+            return manifest
+        with self._lock:
+            manifest = app.extensions["asset_manifest"]
+            if built_before_sources(app.static_folder):
+                manifest = build_assets(app.static_folder)
+            elif manifest is None:
+                with open(os.path.join(app.static_folder, BUILD_DIR,
+                                       MANIFEST), encoding="utf-8") as f:
+                    manifest = json.load(f)
+            app.extensions["asset_manifest"] = manifest
+        return manifest
+
+
+def built_before_sources(static_folder):
+    """Whether the manifest is missing or older than a source file."""
+    try:
+        built = os.path.getmtime(
+            os.path.join(static_folder, BUILD_DIR, MANIFEST))
+    except OSError:
+        return True
+    sources = [source for sources in BUNDLES.values()
+               for source in sources] + FILES
+    return any(os.path.getmtime(os.path.join(static_folder, source)) > built
+               for source in sources)
+
+
+asset_pipeline = AssetPipeline()
+
+
+def asset_url(name):
+    """URL of the build of a bundle in BUNDLES or a file in FILES."""
+    return url_for("assets.asset", filename=asset_pipeline.manifest()[name])
+
+
+#  Serving
+#  ----------------------------------------------------------------
+
+assets = Blueprint('assets', __name__)
+
+
+@assets.route('/static/dist/<path:filename>')
+def asset(filename):
+    """Serve a build with far-future caching, precompressed when the client
+    accepts it. Only hashed names are served: the manifest changes with
+    every build and is not for clients."""
+    if not HASHED_NAME.match(filename):
+        return abort(404)
+    directory = os.path.join(current_app.static_folder, BUILD_DIR)
+    mimetype = mimetypes.guess_type(filename)[0]
+    for encoding, suffix in ENCODINGS:
+        path = safe_join(directory, filename + suffix)
+        if request.accept_encodings[encoding] and path is not None and \
+                os.path.isfile(path):
+            response = send_from_directory(directory, filename + suffix,
+                                           mimetype=mimetype)
+            response.headers["Content-Encoding"] = encoding
+            break
+    else:
+        response = send_from_directory(directory, filename,
+                                       mimetype=mimetype)
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    response.vary.add("Accept-Encoding")
+    return response
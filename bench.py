@@ -0,0 +1,365 @@
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+import babel.dates
+import click
+import dateutil.parser
+from app import DATETIME_FORMATS, create_app, format_datetime
+from cache import page_cache
+from models import db, Artist, Venue
+
+# ----------------------------------------------------------------------------#
+# Per-route benchmark.
+# ----------------------------------------------------------------------------#
+
+app = create_app()
+
+
+def routes(rng, samples):
+    """Build the requests to time: every read route of app.py, each with
+    `samples` variants of its arguments drawn from the seeded data.
+
+    Write routes are left out, as they would change the dataset between
+    runs and make results incomparable across commits.
+    """
+    venue_ids = [id for id, in db.session.query(Venue.id).order_by(Venue.id)]
+    venue_ids = rng.sample(venue_ids, min(samples, len(venue_ids)))
+    artist_ids = [id for id, in
+                  db.session.query(Artist.id).order_by(Artist.id)]
+    artist_ids = rng.sample(artist_ids, min(samples, len(artist_ids)))
+    terms = ["the", "hall", "band", "jazz", "new york", "rock", "velvet"]
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+    return {
+        "index": [("GET", "/", None)],
+        "venues": [("GET", "/venues", None)],
+        "show_venue": [("GET", "/venues/{}".format(id), None)
+                       for id in venue_ids],
+        "search_venues": [("POST", "/venues/search",
+                           {"search_term": rng.choice(terms)})
+                          for _ in range(samples)],
+        "edit_venue": [("GET", "/venues/{}/edit".format(id), None)
+                       for id in venue_ids],
+        "create_venue_form": [("GET", "/venues/create", None)],
+        "artists": [("GET", "/artists", None)],
+        "artists_letter": [("GET", "/artists?letter=" + rng.choice(letters),
+                            None) for _ in range(samples)],
+        "show_artist": [("GET", "/artists/{}".format(id), None)
+                        for id in artist_ids],
+        "search_artists": [("POST", "/artists/search",
+                            {"search_term": rng.choice(terms)})
+                           for _ in range(samples)],
+        "edit_artist": [("GET", "/artists/{}/edit".format(id), None)
+                        for id in artist_ids],
+        "create_artist_form": [("GET", "/artists/create", None)],
+        "shows": [("GET", "/shows", None)],
+        "create_shows": [("GET", "/shows/create", None)],
+    }
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * len(values))))]
+
+
+def run_benchmark(iterations=20, samples=10, seed=42, log=print):
+    """Time every route with the Flask test client and count its queries.
+
+    Returns a JSON-serializable dict with latency percentiles in
+    milliseconds and the median number of SQL statements per request.
+    """
+    rng = random.Random(seed)
+    client = app.test_client()
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    results = {}
+    with app.app_context():
+        db.event.listen(db.engine, "before_cursor_execute", count)
+        try:
+            for route, requests in routes(rng, samples).items():
+                latencies, queries = [], []
+                for _ in range(iterations):
+                    for method, url, data in requests:
+                        statements.clear()
+                        start = time.perf_counter()
+                        response = client.open(url, method=method, data=data)
+                        latencies.append(
+                            (time.perf_counter() - start) * 1000)
+                        queries.append(len(statements))
+                        if response.status_code >= 500:
+                            raise click.ClickException(
+                                "{} {} failed with {}".format(
+                                    method, url, response.status_code))
+                results[route] = {
+                    "requests": len(latencies),
+                    "p50_ms": round(percentile(latencies, 50), 3),
+                    "p90_ms": round(percentile(latencies, 90), 3),
+                    "p99_ms": round(percentile(latencies, 99), 3),
+                    "max_ms": round(max(latencies), 3),
+                    "queries": percentile(queries, 50),
+                }
+                log("{:<20} p50 {p50_ms:>9.2f} ms  p99 {p99_ms:>9.2f} ms  "
+                    "{queries:>5} queries".format(route, **results[route]))
+        finally:
+            db.event.remove(db.engine, "before_cursor_execute", count)
+
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"]).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+@click.group()
+def cli():
+    """Benchmark the Fyyur routes."""
+
+
+@cli.command()
+@click.option('--iterations', default=20, show_default=True,
+              help='Times each request of a route is repeated.')
+@click.option('--samples', default=10, show_default=True,
+              help='Distinct ids or search terms per route.')
+@click.option('--seed', default=42, show_default=True)
+@click.option('--cache/--no-cache', default=False, show_default=True,
+              help='Serve pages from the rendered page cache.')
+@click.option('--output', type=click.Path(dir_okay=False),
+              help='Results file, bench-<commit>.json by default.')
+def run(iterations, samples, seed, cache, output):
+    """Time every route against the configured database."""
+    page_cache.enabled = cache
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "database": app.config["SQLALCHEMY_DATABASE_URI"].split("@")[-1],
+        "iterations": iterations,
+        "samples": samples,
+        "seed": seed,
+        "cache": cache,
+        "routes": run_benchmark(iterations, samples, seed, click.echo),
+    }
+    output = output or "bench-{}.json".format(commit)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    click.echo("Results written to " + output)
+
+
+@cli.command()
+@click.argument('baseline', type=click.File())
+@click.argument('candidate', type=click.File())
+def compare(baseline, candidate):
+    """Compare two results files route by route."""
+    baseline, candidate = json.load(baseline), json.load(candidate)
+    click.echo("{:<20} {:>10} {:>10} {:>8} {:>9}".format(
+        "route", "p50 before", "p50 after", "change", "queries"))
+    for route, after in sorted(candidate["routes"].items()):
+        before = baseline["routes"].get(route)
+        if before is None:
+            click.echo("{:<20} {:>10} {:>10.2f}".format(
+                route, "-", after["p50_ms"]))
+            continue
+        click.echo("{:<20} {:>10.2f} {:>10.2f} {:>+7.0f}% {:>4} -> {}".format(
+            route, before["p50_ms"], after["p50_ms"],
+            (after["p50_ms"] / before["p50_ms"] - 1) * 100,
+            before["queries"], after["queries"]))
+
+
+@cli.command()
+@click.option('--count', default=10000, show_default=True,
+              help='Datetimes formatted per pass.')
+@click.option('--repeat', default=5, show_default=True,
+              help='Passes; the fastest one is reported.')
+def filters(count, repeat):
+    """Time the template datetime filter against the former string
+    round trip through strftime, dateutil and Babel."""
+    start = datetime(2020, 1, 1, 20, 0)
+    values = [start + timedelta(hours=n * 7) for n in range(count)]
+
+    def reparse(value, format):
+        return babel.dates.format_datetime(
+            dateutil.parser.parse(value.strftime('%Y-%m-%d %H:%M:%S')),
+            DATETIME_FORMATS[format])
+
+    def best(function, format):
+        timings = []
+        for _ in range(repeat):
+            begin = time.perf_counter()
+            for value in values:
+                function(value, format)
+            timings.append(time.perf_counter() - begin)
+        return min(timings) / count * 1e6
+
+    for format in DATETIME_FORMATS:
+        before, after = best(reparse, format), best(format_datetime, format)
+        click.echo("{:<8} reparse {:>8.2f} us  direct {:>8.2f} us  "
+                   "{:>5.1f}x".format(format, before, after, before / after))
+
+
+# ----------------------------------------------------------------------------#
+# Concurrency benchmark.
+# ----------------------------------------------------------------------------#
+
+# The read routes that the serving modes are compared on.
+READ_ROUTES = ("venues", "show_venue", "search_venues", "artists",
+               "show_artist", "search_artists", "shows")
+
+# gunicorn command line of each serving mode, given the worker count.
+SERVING_MODES = {
+    "sync": lambda workers: [
+        "--worker-class", "sync", "--workers", str(workers),
+        "app:create_app()"],
+    "gevent": lambda workers: [
+        "--worker-class", "gevent", "--workers", str(workers),
+        "--worker-connections", "1000", "serve:application"],
+}
+
+
+def start_server(mode, workers, port, cache):
+    """Start gunicorn in `mode` and wait until it accepts connections."""
+    env = dict(os.environ, PAGE_CACHE_ENABLED="1" if cache else "0")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--bind",
+         "127.0.0.1:{}".format(port), "--timeout", "120"]
+        + SERVING_MODES[mode](workers),
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise click.ClickException(
+                "gunicorn exited with {}".format(server.returncode))
+        try:
+            socket.create_connection(("127.0.0.1", port), 1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise click.ClickException("gunicorn did not start within 30 s")
+
+
+def run_load(port, requests, clients, duration, seed):
+    """Send `requests` from `clients` concurrent connections for `duration`
+    seconds and return the latencies in milliseconds and the error count."""
+    deadline = time.perf_counter() + duration
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def client(n):
+        rng = random.Random(seed + n)
+        connection = http.client.HTTPConnection("127.0.0.1", port,
+                                                timeout=120)
+        mine, failed = [], 0
+        while time.perf_counter() < deadline:
+            method, url, data = rng.choice(requests)
+            body = urlencode(data) if data else None
+            headers = {"Content-Type": "application/x-www-form-urlencoded"} \
+                if data else {}
+            start = time.perf_counter()
+            try:
+                connection.request(method, url, body, headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 500:
+                    failed += 1
+                    continue
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                failed += 1
+                continue
+            mine.append((time.perf_counter() - start) * 1000)
+        connection.close()
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client, args=(n,))
+               for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+@cli.command()
+@click.option('--clients', default='10,100,500', show_default=True,
+              help='Comma separated numbers of concurrent clients.')
+@click.option('--duration', default=20, show_default=True,
+              help='Seconds of load per serving mode and client count.')
+@click.option('--workers', default=4, show_default=True,
+              help='gunicorn worker processes in both modes.')
+@click.option('--samples', default=10, show_default=True,
+              help='Distinct ids or search terms per route.')
+@click.option('--seed', default=42, show_default=True)
+@click.option('--port', default=5099, show_default=True)
+@click.option('--cache/--no-cache', default=False, show_default=True,
+              help='Serve pages from the rendered page cache.')
+@click.option('--output', type=click.Path(dir_okay=False),
+              help='Results file, bench-concurrency-<commit>.json by '
+                   'default.')
+def concurrency(clients, duration, workers, samples, seed, port, cache,
+                output):
+    """Compare the throughput of the read routes served by sync and by
+    gevent gunicorn workers under increasing numbers of clients."""
+    with app.app_context():
+        requests = [request for route, requests
+                    in routes(random.Random(seed), samples).items()
+                    if route in READ_ROUTES for request in requests]
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "database": app.config["SQLALCHEMY_DATABASE_URI"].split("@")[-1],
+        "workers": workers,
+        "duration": duration,
+        "cache": cache,
+        "modes": {},
+    }
+    click.echo("{:<8} {:>7} {:>10} {:>9} {:>9} {:>7}".format(
+        "mode", "clients", "req/s", "p50 ms", "p99 ms", "errors"))
+    for mode in SERVING_MODES:
+        server = start_server(mode, workers, port, cache)
+        try:
+            run_load(port, requests, workers, 2, seed)
+            for count in (int(n) for n in clients.split(",")):
+                latencies, errors = run_load(port, requests, count,
+                                             duration, seed)
+                result = {
+                    "requests": len(latencies),
+                    "errors": errors,
+                    "throughput": round(len(latencies) / duration, 1),
+                    "p50_ms": round(percentile(latencies, 50), 3)
+                    if latencies else None,
+                    "p99_ms": round(percentile(latencies, 99), 3)
+                    if latencies else None,
+                }
+                results["modes"].setdefault(mode, {})[count] = result
+                click.echo("{:<8} {:>7} {:>10.1f} {:>9} {:>9} {:>7}".format(
+                    mode, count, result["throughput"], result["p50_ms"],
+                    result["p99_ms"], errors))
+        finally:
+            server.terminate()
+            server.wait()
+    output = output or "bench-concurrency-{}.json".format(commit)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    click.echo("Results written to " + output)
+
+
+if __name__ == '__main__':
+    cli()
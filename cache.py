@@ -0,0 +1,199 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, current_app, request, session
+from models import changed_tables, db
+from replicas import reading_from_replica
+
+# ----------------------------------------------------------------------------#
+# Rendered page cache.
+# ----------------------------------------------------------------------------#
+
+
+class PageCache:
+    """In-process LRU cache of rendered pages.
+
+    Entries are bounded by count, total body size and age, and are tagged
+    with the tables the page was rendered from. Committing a change to one
+    of those tables drops every entry tagged with it, so a cached page is
+    never served after a write that would change it.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024,
+                 ttl=300):
+        self.enabled = True
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._size = 0
+        self._invalidated = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        self.enabled = app.config.get("PAGE_CACHE_ENABLED", self.enabled)
+        self.max_entries = app.config.get("PAGE_CACHE_MAX_ENTRIES",
+                                          self.max_entries)
+        self.max_bytes = app.config.get("PAGE_CACHE_MAX_BYTES",
+                                        self.max_bytes)
+        self.ttl = app.config.get("PAGE_CACHE_TTL", self.ttl)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, body, mimetype, tables):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl,
+                                  (body, mimetype), frozenset(tables))
+            self._size += len(body)
+            while len(self._entries) > self.max_entries or \
+                    self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, tables):
+        """Drop every entry rendered from any of `tables`."""
+        now = time.monotonic()
+        with self._lock:
+            for table in tables:
+                self._invalidated[table] = now
+            stale = [key for key, entry in self._entries.items()
+                     if entry[2] & tables]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+
+    def invalidated_since(self, tables, since):
+        """Whether any of `tables` was invalidated after `since`, a
+        time.monotonic() value."""
+        with self._lock:
+            return any(self._invalidated.get(table, since) > since
+                       for table in tables)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+    def _remove(self, key):
+        self._size -= len(self._entries.pop(key)[1][0])
+
+
+page_cache = PageCache()
+
+
+def cached_page(*tables):
+    """Serve a GET view from page_cache, keyed by its path and query string.
+
+    `tables` names every table the rendered page depends on. Responses that
+    are not a plain 200 and requests with pending flash messages, which are
+    rendered into the page, bypass the cache.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not page_cache.enabled or "_flashes" in session:
+                return view(*args, **kwargs)
+
+            key = request.full_path
+            cached = page_cache.get(key)
+            if cached is not None:
+                return Response(cached[0], mimetype=cached[1])
+
+            start = time.monotonic()
+            response = current_app.make_response(view(*args, **kwargs))
+            # A write that committed while the page was rendered may have
+            # been read before it, and a replica may not have caught up
+            # with a recent one yet; such pages are not stored.
+            if reading_from_replica():
+                start -= current_app.config.get("DB_REPLICA_STICKY_SECONDS",
+                                                0)
+            if page_cache.invalidated_since(tables, start):
+                return response
+            if response.status_code == 200 and not response.is_streamed:
+                page_cache.set(key, response.get_data(), response.mimetype,
+                               tables)
+            return response
+        return wrapper
+    return decorator
+
+
+# ----------------------------------------------------------------------------#
+# Invalidation.
+# ----------------------------------------------------------------------------#
+
+
+@db.event.listens_for(db.session, "after_flush")
+def track_flushed_tables(session, flush_context):
+    for instance in session.new | session.dirty | session.deleted:
+        table = getattr(instance, "__tablename__", None)
+        if table is not None:
+            changed_tables(session).add(table)
+
+
+def _cascaded_tables(table):
+    """Name `table` and every table whose rows the database deletes along
+    with it through ON DELETE CASCADE foreign keys."""
+    tables, pending = set(), [table]
+    while pending:
+        table = pending.pop()
+        tables.add(table.name)
+        pending.extend(
+            other for other in db.metadata.sorted_tables
+            if other.name not in tables and any(
+                fk.column.table is table and fk.ondelete == "CASCADE"
+                for fk in other.foreign_keys))
+    return tables
+
+
+@db.event.listens_for(db.session, "after_bulk_update")
+def track_bulk_tables(context):
+    changed_tables(context.session).add(
+        context.mapper.class_.__tablename__)
+
+
+@db.event.listens_for(db.session, "after_bulk_delete")
+def track_bulk_deleted_tables(context):
+    changed_tables(context.session).update(
+        _cascaded_tables(context.mapper.local_table))
+
+
+@db.event.listens_for(db.session, "after_commit")
+def invalidate_committed_tables(session):
+    tables = session.info.pop("changed_tables", None)
+    if tables:
+        page_cache.invalidate(tables)
+
+
+@db.event.listens_for(db.session, "after_rollback")
+def forget_rolled_back_tables(session):
+    session.info.pop("changed_tables", None)
@@ -0,0 +1,180 @@
+import random
+from datetime import datetime, timedelta
+from models import db, recount_shows, Artist, ArtistGenre, Genre, Show, \
+    Venue, VenueGenre
+
+# ----------------------------------------------------------------------------#
+# Synthetic dataset generator.
+# ----------------------------------------------------------------------------#
+
+# Relative popularity of the genres offered by the forms.
+GENRES = [
+    ("Rock n Roll", 18), ("Pop", 16), ("Jazz", 10), ("Hip-Hop", 10),
+    ("Electronic", 9), ("Alternative", 8), ("Country", 7), ("R&B", 6),
+    ("Blues", 5), ("Folk", 5), ("Classical", 4), ("Heavy Metal", 4),
+    ("Punk", 3), ("Soul", 3), ("Funk", 3), ("Reggae", 2),
+    ("Instrumental", 2), ("Musical Theatre", 1), ("Other", 1),
+]
+
+# Cities weighted roughly by the size of their live music scene.
+CITIES = [
+    ("New York", "NY", 20), ("Los Angeles", "CA", 16), ("Chicago", "IL", 9),
+    ("Nashville", "TN", 8), ("Austin", "TX", 8), ("San Francisco", "CA", 7),
+    ("Seattle", "WA", 5), ("New Orleans", "LA", 5), ("Atlanta", "GA", 4),
+    ("Boston", "MA", 4), ("Denver", "CO", 3), ("Portland", "OR", 3),
+    ("Philadelphia", "PA", 3), ("Detroit", "MI", 2), ("Miami", "FL", 2),
+    ("Minneapolis", "MN", 2), ("Memphis", "TN", 2), ("Houston", "TX", 2),
+    ("Phoenix", "AZ", 1), ("Kansas City", "MO", 1),
+]
+
+WORDS = [
+    "Velvet", "Electric", "Midnight", "Golden", "Silver", "Wild", "Blue",
+    "Crimson", "Lonely", "Hollow", "Neon", "Broken", "Rolling", "Howling",
+    "Lucky", "Paper", "Iron", "Sonic", "Static", "Northern", "Southern",
+    "Rusty", "Cosmic", "Gentle", "Burning", "Hidden", "Restless", "Fading",
+]
+ARTIST_NOUNS = [
+    "Band", "Collective", "Trio", "Quartet", "Orchestra", "Kids", "Sisters",
+    "Brothers", "Ghosts", "Wolves", "Machines", "Petals", "Saints", "Echoes",
+]
+VENUE_NOUNS = [
+    "Hall", "Lounge", "Club", "Tavern", "Theatre", "Ballroom", "Cellar",
+    "Garden", "Room", "Bar", "Stage", "Warehouse", "Cafe", "Arena",
+]
+
+
+class DatasetGenerator:
+    """Seed the database with a deterministic, realistically skewed dataset.
+
+    The same seed and volumes always produce the same rows. Genres and
+    cities follow the popularity weights above, and a few venues and
+    artists host most of the shows, as in real booking data. Rows are
+    written with batched executemany INSERTs, so memory use is bounded by
+    `batch_size` rather than by the volumes, and each batch is committed
+    on its own.
+    """
+
+    def __init__(self, artists=1000, venues=200, shows=20000, seed=42,
+                 batch_size=10000):
+        self.artists = artists
+        self.venues = venues
+        self.shows = shows
+        self.seed = seed
+        self.batch_size = batch_size
+
+    def run(self, log=print):
+        rng = random.Random(self.seed)
+        artist_offset = self._max_id(Artist)
+        venue_offset = self._max_id(Venue)
+        show_offset = self._max_id(Show)
+        self.genre_ids = Genre.ids(name for name, _ in GENRES)
+        db.session.commit()
+
+        self._insert(Artist, ArtistGenre, "artist_id", self.artists,
+                     artist_offset, self._artist, rng, log)
+        self._insert(Venue, VenueGenre, "venue_id", self.venues,
+                     venue_offset, self._venue, rng, log)
+
+        now = datetime.now().replace(minute=0, second=0, microsecond=0)
+        batch = []
+        for n in range(1, self.shows + 1):
+            batch.append({
+                "id": show_offset + n,
+                "artist_id": artist_offset + self._skewed(rng, self.artists),
+                "venue_id": venue_offset + self._skewed(rng, self.venues),
+                "start_time": now + timedelta(
+                    hours=rng.randint(-3 * 365 * 24, 365 * 24)),
+            })
+            if len(batch) == self.batch_size:
+                self._flush(Show, batch, log)
+        self._flush(Show, batch, log)
+
+        recount_shows(Venue, Show.venue_id)
+        recount_shows(Artist, Show.artist_id)
+        self._reset_sequences()
+        db.session.commit()
+
+    def _insert(self, entity, genre_entity, fk, count, offset, make, rng,
+                log):
+        rows, genres = [], []
+        for n in range(1, count + 1):
+            id = offset + n
+            rows.append(make(rng, id))
+            picked = rng.choices([name for name, _ in GENRES],
+                                 [weight for _, weight in GENRES],
+                                 k=rng.randint(1, 3))
+            genres.extend({fk: id, "genre_id": self.genre_ids[genre]}
+                          for genre in set(picked))
+            if len(rows) == self.batch_size:
+                self._flush(entity, rows, log)
+                self._flush(genre_entity, genres, log)
+        self._flush(entity, rows, log)
+        self._flush(genre_entity, genres, log)
+
+    def _artist(self, rng, id):
+        city, state = self._city(rng)
+        return {
+            "id": id,
+            "name": "{} {} {}".format(rng.choice(WORDS),
+                                      rng.choice(ARTIST_NOUNS), id),
+            "city": city,
+            "state": state,
+            "phone": "{:03}-{:03}-{:04}".format(rng.randint(200, 999),
+                                                rng.randint(0, 999),
+                                                rng.randint(0, 9999)),
+            "website": None,
+            "facebook_link": None,
+            "image_link": None,
+            "seeking_venue": rng.random() < 0.3,
+            "seeking_description": "",
+        }
+
+    def _venue(self, rng, id):
+        city, state = self._city(rng)
+        return {
+            "id": id,
+            "name": "The {} {} {}".format(rng.choice(WORDS),
+                                          rng.choice(VENUE_NOUNS), id),
+            "address": "{} Main Street".format(rng.randint(1, 9999)),
+            "city": city,
+            "state": state,
+            "phone": "{:03}-{:03}-{:04}".format(rng.randint(200, 999),
+                                                rng.randint(0, 999),
+                                                rng.randint(0, 9999)),
+            "website": None,
+            "facebook_link": None,
+            "image_link": None,
+            "seeking_talent": rng.random() < 0.3,
+            "seeking_description": "",
+        }
+
+    @staticmethod
+    def _city(rng):
+        city, state, _ = rng.choices(CITIES, [c[2] for c in CITIES])[0]
+        return city, state
+
+    @staticmethod
+    def _skewed(rng, count):
+        """Pick a number in 1..count, favouring the low end."""
+        return int(count * rng.random() ** 2) + 1
+
+    @staticmethod
+    def _max_id(entity):
+        return db.session.query(db.func.max(entity.id)).scalar() or 0
+
+    @staticmethod
+    def _flush(entity, rows, log):
+        if rows:
+            db.session.execute(entity.__table__.insert(), rows)
+            db.session.commit()
+            log("{}: {} rows".format(entity.__tablename__, len(rows)))
+            rows.clear()
+
+    @staticmethod
+    def _reset_sequences():
+        if db.session.get_bind().dialect.name != "postgresql":
+            return
+        for table in ("Artist", "Venue", "Show"):
+            db.session.execute(
+                "SELECT setval(pg_get_serial_sequence('\"{0}\"', 'id'), "
+                "(SELECT coalesce(max(id), 1) FROM \"{0}\"))".format(table))
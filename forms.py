@@ -1,7 +1,9 @@
 from datetime import datetime
 from flask_wtf import FlaskForm
 from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField
-from wtforms.validators import DataRequired, URL
+from wtforms import IntegerField
+from wtforms.widgets import HiddenInput
+from wtforms.validators import DataRequired, NumberRange, Optional, URL
 
 
 class ShowForm(FlaskForm):
@@ -16,9 +18,19 @@ class ShowForm(FlaskForm):
         validators=[DataRequired()],
         default=datetime.today()
     )
+    # Minutes; the venue and the artist are booked for that long.
+    duration = IntegerField(
+        'duration',
+        validators=[Optional(), NumberRange(min=1, max=24 * 60)],
+        default=120
+    )
 
 
 class VenueForm(FlaskForm):
+    # Row version the edit form was rendered from.
+    version = IntegerField(
+        'version', widget=HiddenInput()
+    )
     name = StringField(
         'name', validators=[DataRequired()]
     )
@@ -127,6 +139,10 @@ class VenueForm(FlaskForm):
 
 
 class ArtistForm(FlaskForm):
+    # Row version the edit form was rendered from.
+    version = IntegerField(
+        'version', widget=HiddenInput()
+    )
     name = StringField(
         'name', validators=[DataRequired()]
     )
@@ -0,0 +1,275 @@
+import csv
+import io
+import json
+import time
+from datetime import datetime, timedelta
+from models import DEFAULT_SHOW_DURATION, MAX_SHOW_DURATION, \
+    changed_tables, db, request_now, Artist, ArtistGenre, BookingCalendar, \
+    Genre, Show, Venue, VenueGenre
+
+# ----------------------------------------------------------------------------#
+# Bulk import.
+# ----------------------------------------------------------------------------#
+
+TRUE_VALUES = {"1", "true", "t", "yes", "y"}
+
+
+def read_records(file, format=None):
+    """Stream records from a CSV file with a header row or from a JSON Lines
+    file, one dict at a time."""
+    format = format or ("jsonl" if file.name.endswith((".jsonl", ".json"))
+                        else "csv")
+    if format == "csv":
+        yield from csv.DictReader(file)
+    else:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def batched(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Importer:
+    """Insert venues, artists or shows from a stream of records in batches.
+
+    Each batch is written with one executemany INSERT per table, or with
+    COPY for shows on Postgres, and committed on its own, so memory use
+    depends on `batch_size` only. Venue and artist ids are allocated up
+    front so their genres can be inserted in the same batch. Shows refer
+    to their venue and artist either by id or by exact name; the names of
+    a batch are resolved with one query per table, and shows whose venue
+    or artist cannot be found are skipped, as are shows that overlap a
+    show of their venue or artist, stored or earlier in the file.
+    """
+
+    def __init__(self, batch_size=1000, log=print):
+        self.batch_size = batch_size
+        self.log = log
+        self.inserted = 0
+        self.skipped = 0
+
+    def run(self, kind, records):
+        load = {"venues": self._venues, "artists": self._artists,
+                "shows": self._shows}[kind]
+        start = time.perf_counter()
+        for batch in batched(records, self.batch_size):
+            try:
+                load(batch)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            elapsed = time.perf_counter() - start
+            self.log("{} rows imported, {} skipped, {:.0f} rows/s".format(
+                self.inserted, self.skipped, self.inserted / elapsed))
+        return self.inserted, self.skipped
+
+    def _venues(self, batch):
+        ids = self._allocate_ids(Venue, len(batch))
+        rows, genres = [], []
+        for id, record in zip(ids, batch):
+            rows.append({
+                "id": id,
+                "name": record["name"],
+                "address": record["address"],
+                "city": record["city"],
+                "state": record["state"],
+                "phone": record.get("phone") or "",
+                "website": record.get("website") or None,
+                "facebook_link": record.get("facebook_link") or None,
+                "image_link": record.get("image_link") or None,
+                "seeking_talent": self._bool(record.get("seeking_talent")),
+                "seeking_description":
+                    record.get("seeking_description") or "",
+            })
+            genres.extend((id, genre) for genre in self._genres(record))
+        self._insert(Venue, rows)
+        self._insert(VenueGenre, self._genre_rows("venue_id", genres))
+        self.inserted += len(rows)
+
+    def _artists(self, batch):
+        ids = self._allocate_ids(Artist, len(batch))
+        rows, genres = [], []
+        for id, record in zip(ids, batch):
+            rows.append({
+                "id": id,
+                "name": record["name"],
+                "city": record["city"],
+                "state": record["state"],
+                "phone": record.get("phone") or "",
+                "website": record.get("website") or None,
+                "facebook_link": record.get("facebook_link") or None,
+                "image_link": record.get("image_link") or None,
+                "seeking_venue": self._bool(record.get("seeking_venue")),
+                "seeking_description":
+                    record.get("seeking_description") or "",
+            })
+            genres.extend((id, genre) for genre in self._genres(record))
+        self._insert(Artist, rows)
+        self._insert(ArtistGenre, self._genre_rows("artist_id", genres))
+        self.inserted += len(rows)
+
+    def _shows(self, batch):
+        venues = self._resolve(Venue, batch, "venue")
+        artists = self._resolve(Artist, batch, "artist")
+        now = request_now()
+        candidates = []
+        for record in batch:
+            venue_id = venues.get(self._reference(record, "venue"))
+            artist_id = artists.get(self._reference(record, "artist"))
+            duration = int(record.get("duration") or DEFAULT_SHOW_DURATION)
+            if venue_id is None or artist_id is None or \
+                    not 1 <= duration <= MAX_SHOW_DURATION:
+                self.skipped += 1
+                continue
+            start_time = datetime.fromisoformat(
+                str(record["start_time"]).rstrip("Z"))
+            candidates.append({"venue_id": venue_id, "artist_id": artist_id,
+                               "start_time": start_time,
+                               "duration": duration})
+
+        rows, deltas = [], {}
+        for row in self._bookable(candidates):
+            rows.append(row)
+            index = 0 if row["start_time"] >= now else 1
+            for key in ((Venue, row["venue_id"]), (Artist, row["artist_id"])):
+                deltas.setdefault(key, [0, 0])[index] += 1
+
+        if db.session.get_bind().dialect.name == "postgresql":
+            self._copy(Show, rows)
+        else:
+            self._insert(Show, rows)
+        self.inserted += len(rows)
+
+        for entity in (Venue, Artist):
+            counts = [{"entity_id": id, "upcoming": upcoming, "past": past}
+                      for (e, id), (upcoming, past) in deltas.items()
+                      if e is entity]
+            if counts:
+                db.session.execute(
+                    entity.__table__.update()
+                    .where(entity.id == db.bindparam("entity_id"))
+                    .values(upcoming_show_count=entity.upcoming_show_count
+                            + db.bindparam("upcoming"),
+                            past_show_count=entity.past_show_count
+                            + db.bindparam("past")),
+                    counts)
+                changed_tables(db.session).add(entity.__tablename__)
+
+    def _bookable(self, rows):
+        """Yield the `rows` that overlap no show of their venue or artist,
+        already stored or earlier in the batch, and skip the others.
+
+        As in Show.create(), the venue and artist rows are locked first, so
+        that shows booked meanwhile are checked against these."""
+        checks = []
+        for entity, show_fk in ((Venue, Show.venue_id),
+                                (Artist, Show.artist_id)):
+            ids = sorted({row[show_fk.key] for row in rows})
+            if ids:
+                db.session.query(entity.id).filter(entity.id.in_(ids)) \
+                    .order_by(entity.id).with_for_update().all()
+            checks.append((show_fk.key, BookingCalendar(show_fk, [
+                (row[show_fk.key], row["start_time"], self._end(row))
+                for row in rows])))
+        for row in rows:
+            end = self._end(row)
+            if any(calendar.conflicts(row[key], row["start_time"], end)
+                   for key, calendar in checks):
+                self.skipped += 1
+                continue
+            for key, calendar in checks:
+                calendar.book(row[key], row["start_time"], end)
+            yield row
+
+    @staticmethod
+    def _end(row):
+        return row["start_time"] + timedelta(minutes=row["duration"])
+
+    @staticmethod
+    def _reference(record, name):
+        """Return how a show record refers to its venue or artist."""
+        if record.get(name + "_id"):
+            return ("id", int(record[name + "_id"]))
+        return ("name", record.get(name))
+
+    def _resolve(self, entity, batch, name):
+        """Map the references a batch of shows makes to `entity` to ids,
+        with at most two queries."""
+        references = {self._reference(record, name) for record in batch}
+        ids = {value for kind, value in references if kind == "id"}
+        names = {value for kind, value in references if kind == "name"}
+        resolved = {}
+        if ids:
+            resolved.update((("id", id), id) for id, in
+                            db.session.query(entity.id)
+                            .filter(entity.id.in_(ids)))
+        if names:
+            resolved.update((("name", name), id) for name, id in
+                            db.session.query(entity.name,
+                                             db.func.min(entity.id))
+                            .filter(entity.name.in_(names))
+                            .group_by(entity.name))
+        return resolved
+
+    @staticmethod
+    def _insert(entity, rows):
+        if rows:
+            db.session.execute(entity.__table__.insert(), rows)
+            changed_tables(db.session).add(entity.__tablename__)
+
+    @staticmethod
+    def _copy(entity, rows):
+        if not rows:
+            return
+        columns = list(rows[0])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([row[column] for column in columns])
+        buffer.seek(0)
+        cursor = db.session.connection().connection.cursor()
+        cursor.copy_expert(
+            'COPY "{}" ({}) FROM STDIN WITH (FORMAT csv)'.format(
+                entity.__tablename__, ", ".join(columns)), buffer)
+        changed_tables(db.session).add(entity.__tablename__)
+
+    @staticmethod
+    def _allocate_ids(entity, count):
+        """Reserve `count` primary keys for `entity` in one query."""
+        if db.session.get_bind().dialect.name == "postgresql":
+            return [id for id, in db.session.execute(
+                "SELECT nextval(pg_get_serial_sequence('\"{}\"', 'id')) "
+                "FROM generate_series(1, :count)".format(
+                    entity.__tablename__), {"count": count})]
+        start = (db.session.query(db.func.max(entity.id)).scalar() or 0) + 1
+        return list(range(start, start + count))
+
+    @staticmethod
+    def _genre_rows(fk, genres):
+        """Turn (entity id, genre name) pairs into association rows,
+        adding the genres that do not exist yet."""
+        ids = Genre.ids(name for _, name in genres)
+        return [{fk: id, "genre_id": ids[name]} for id, name in genres]
+
+    @staticmethod
+    def _genres(record):
+        genres = record.get("genres") or []
+        if isinstance(genres, str):
+            genres = genres.split(";")
+        return sorted({genre.strip() for genre in genres if genre.strip()})
+
+    @staticmethod
+    def _bool(value):
+        if isinstance(value, bool):
+            return value
+        return str(value or "").strip().lower() in TRUE_VALUES
@@ -0,0 +1,335 @@
+import json
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from flask import Response, current_app, g, has_request_context, request
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool, QueuePool
+from cache import page_cache
+from models import db, Artist, Show, Venue
+from replicas import reading_from_replica
+
+# ----------------------------------------------------------------------------#
+# Query and connection pool metrics.
+# ----------------------------------------------------------------------------#
+
+# Upper bounds, in seconds, of the request duration histogram buckets.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_IN_LISTS = re.compile(r"\bIN \((?:[^()]|\([^()]*\))*\)", re.IGNORECASE)
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def statement_shape(statement):
+    """Reduce a statement to its shape, so that statements differing only
+    in their literals or in the length of an IN list compare equal."""
+    shape = _LITERALS.sub("?", _IN_LISTS.sub("IN (?)", statement))
+    return " ".join(shape.split())
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports how long each checkout took, including any
+    wait for a connection to be returned to a full pool."""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            query_metrics.record_pool_wait(time.perf_counter() - start)
+
+
+class RequestStats:
+    __slots__ = ("start", "queries", "db_time", "pool_wait", "slowest",
+                 "shapes")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.pool_wait = 0.0
+        self.slowest = []
+        self.shapes = Counter()
+
+
+class QueryMetrics:
+    """Collect query, connection pool and request metrics.
+
+    Every statement is timed with engine events and attributed to the
+    request being handled and to the `Artist`, `Venue` or `Show` method
+    that issued it. Totals are exported in the Prometheus text format at
+    /metrics, and each request is summarized in one JSON log line that
+    lists its slowest statements. A request that runs the same statement
+    shape more than `n_plus_one` times is counted and logged as a
+    suspected N+1 query.
+    """
+
+    def __init__(self, n_plus_one=10, slowest=3, log_requests=True):
+        self.enabled = True
+        self.n_plus_one = n_plus_one
+        self.slowest = slowest
+        self.log_requests = log_requests
+        self._sources = {}
+        self._lock = threading.Lock()
+        self.requests = Counter()
+        self.request_seconds = {}
+        self.queries = Counter()
+        self.query_seconds = Counter()
+        self.suspected_n_plus_one = Counter()
+        self.pool_checkouts = 0
+        self.pool_wait_seconds = 0.0
+
+    def init_app(self, app):
+        self.enabled = app.config.get("QUERY_METRICS_ENABLED", self.enabled)
+        self.n_plus_one = app.config.get("QUERY_N_PLUS_ONE_THRESHOLD",
+                                         self.n_plus_one)
+        self.slowest = app.config.get("QUERY_LOG_SLOWEST", self.slowest)
+        self.log_requests = app.config.get("QUERY_LOG_REQUESTS",
+                                           self.log_requests)
+        if not self.enabled:
+            return
+
+        # Time pool checkouts; SQLite does not use a QueuePool.
+        options = dict(app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+        if not app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+            options.setdefault("poolclass", TimedQueuePool)
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+
+        for entity in (Artist, Venue, Show):
+            for name, attr in vars(entity).items():
+                attr = getattr(attr, "__func__", None) or \
+                    getattr(attr, "fget", None) or attr
+                code = getattr(attr, "__code__", None)
+                if code is not None:
+                    self._sources[code] = entity.__name__ + "." + name
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule("/metrics", "metrics", self.export)
+
+    def source(self):
+        """Name the model method that is running the current statement."""
+        frame = sys._getframe(2)
+        while frame is not None:
+            source = self._sources.get(frame.f_code)
+            if source is not None:
+                return source
+            frame = frame.f_back
+        return "other"
+
+    def record_query(self, statement, seconds, source):
+        with self._lock:
+            self.queries[source] += 1
+            self.query_seconds[source] += seconds
+        if not has_request_context() or "db_stats" not in g:
+            return
+        stats = g.db_stats
+        stats.queries += 1
+        stats.db_time += seconds
+        stats.shapes[statement_shape(statement)] += 1
+        stats.slowest.append((seconds, source, statement))
+        stats.slowest.sort(key=lambda entry: entry[0], reverse=True)
+        del stats.slowest[self.slowest:]
+
+    def record_checkout(self):
+        with self._lock:
+            self.pool_checkouts += 1
+
+    def record_pool_wait(self, seconds):
+        with self._lock:
+            self.pool_wait_seconds += seconds
+        if has_request_context() and "db_stats" in g:
+            g.db_stats.pool_wait += seconds
+
+    def _start_request(self):
+        g.db_stats = RequestStats()
+
+    def _finish_request(self, response):
+        stats = g.get("db_stats")
+        if stats is None:
+            return response
+        summary = {
+            "method": request.method,
+            "path": request.full_path.rstrip("?"),
+            "endpoint": request.endpoint or "none",
+            "status": response.status_code,
+            "replica": reading_from_replica(),
+        }
+        logger = current_app.logger
+        if response.is_streamed:
+            # The body, and the queries that produce it, run after this
+            # hook; g.db_stats keeps collecting them until it is sent.
+            response.call_on_close(
+                lambda: self._summarize(stats, summary, logger))
+        else:
+            del g.db_stats
+            self._summarize(stats, summary, logger)
+        return response
+
+    def _summarize(self, stats, summary, logger):
+        """Count a finished request in the totals and log its summary."""
+        elapsed = time.perf_counter() - stats.start
+        endpoint = summary["endpoint"]
+        repeated = [(shape, count) for shape, count in stats.shapes.items()
+                    if count > self.n_plus_one]
+
+        with self._lock:
+            self.requests[endpoint, summary["method"],
+                          summary["status"]] += 1
+            histogram = self.request_seconds.setdefault(
+                endpoint, [0] * len(BUCKETS) + [0.0, 0])
+            for n, bound in enumerate(BUCKETS):
+                if elapsed <= bound:
+                    histogram[n] += 1
+            histogram[-2] += elapsed
+            histogram[-1] += 1
+            if repeated:
+                self.suspected_n_plus_one[endpoint] += 1
+
+        if self.log_requests:
+            logger.info(json.dumps(dict(
+                summary,
+                duration_ms=round(elapsed * 1000, 3),
+                queries=stats.queries,
+                db_ms=round(stats.db_time * 1000, 3),
+                pool_wait_ms=round(stats.pool_wait * 1000, 3),
+                slowest=[{"ms": round(seconds * 1000, 3),
+                          "source": source,
+                          "statement": " ".join(statement.split())[:200]}
+                         for seconds, source, statement in stats.slowest],
+                n_plus_one=[{"count": count, "statement": shape[:200]}
+                            for shape, count in repeated],
+            ), sort_keys=True))
+        for shape, count in repeated:
+            logger.warning(
+                "Suspected N+1 query on %s: %d executions of %s",
+                endpoint, count, shape[:200])
+
+    def export(self):
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+
+        def metric(name, kind, description, samples):
+            lines.append("# HELP {} {}".format(name, description))
+            lines.append("# TYPE {} {}".format(name, kind))
+            for labels, value in samples:
+                lines.append("{}{} {}".format(name, _labels(labels), value))
+
+        with self._lock:
+            metric("fyyur_http_requests_total", "counter",
+                   "Requests handled, by endpoint, method and status.",
+                   [({"endpoint": endpoint, "method": method,
+                      "status": status}, count)
+                    for (endpoint, method, status), count
+                    in sorted(self.requests.items())])
+
+            lines.append("# HELP fyyur_http_request_duration_seconds "
+                         "Request handling time, by endpoint.")
+            lines.append("# TYPE fyyur_http_request_duration_seconds "
+                         "histogram")
+            for endpoint, histogram in sorted(self.request_seconds.items()):
+                for bound, count in zip(BUCKETS, histogram):
+                    lines.append(
+                        "fyyur_http_request_duration_seconds_bucket{} {}"
+                        .format(_labels({"endpoint": endpoint,
+                                         "le": bound}), count))
+                labels = _labels({"endpoint": endpoint})
+                lines.append(
+                    "fyyur_http_request_duration_seconds_bucket{} {}".format(
+                        _labels({"endpoint": endpoint, "le": "+Inf"}),
+                        histogram[-1]))
+                lines.append("fyyur_http_request_duration_seconds_sum{} {}"
+                             .format(labels, histogram[-2]))
+                lines.append("fyyur_http_request_duration_seconds_count{} {}"
+                             .format(labels, histogram[-1]))
+
+            metric("fyyur_db_queries_total", "counter",
+                   "SQL statements executed, by issuing model method.",
+                   [({"source": source}, count)
+                    for source, count in sorted(self.queries.items())])
+            metric("fyyur_db_query_seconds_total", "counter",
+                   "Time spent executing SQL, by issuing model method.",
+                   [({"source": source}, seconds)
+                    for source, seconds
+                    in sorted(self.query_seconds.items())])
+            metric("fyyur_db_suspected_n_plus_one_total", "counter",
+                   "Requests that repeated a statement shape more than "
+                   "{} times.".format(self.n_plus_one),
+                   [({"endpoint": endpoint}, count)
+                    for endpoint, count
+                    in sorted(self.suspected_n_plus_one.items())])
+            metric("fyyur_db_pool_checkouts_total", "counter",
+                   "Connections checked out of the pool.",
+                   [({}, self.pool_checkouts)])
+            metric("fyyur_db_pool_wait_seconds_total", "counter",
+                   "Time spent checking connections out of the pool.",
+                   [({}, self.pool_wait_seconds)])
+
+        pool = db.get_engine().pool
+        if isinstance(pool, QueuePool):
+            metric("fyyur_db_pool_size", "gauge",
+                   "Connections kept open by the pool.",
+                   [({}, pool.size())])
+            metric("fyyur_db_pool_checked_out", "gauge",
+                   "Connections currently checked out.",
+                   [({}, pool.checkedout())])
+            metric("fyyur_db_pool_overflow", "gauge",
+                   "Connections open beyond the pool size.",
+                   [({}, max(pool.overflow(), 0))])
+
+        cache = page_cache.stats()
+        for name in ("hits", "misses", "evictions", "invalidations"):
+            metric("fyyur_page_cache_{}_total".format(name), "counter",
+                   "Page cache {}.".format(name), [({}, cache[name])])
+        metric("fyyur_page_cache_bytes", "gauge",
+               "Size of the cached pages.", [({}, cache["bytes"])])
+
+        return Response("\n".join(lines) + "\n",
+                        mimetype="text/plain; version=0.0.4")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\")
+                         .replace('"', '\\"'))
+        for name, value in labels.items()) + "}"
+
+
+query_metrics = QueryMetrics()
+
+
+# ----------------------------------------------------------------------------#
+# Engine and pool events.
+# ----------------------------------------------------------------------------#
+
+
+@db.event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context,
+                      executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@db.event.listens_for(Engine, "after_cursor_execute")
+def stop_query_timer(conn, cursor, statement, parameters, context,
+                     executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    if query_metrics.enabled:
+        query_metrics.record_query(statement, elapsed,
+                                   query_metrics.source())
+
+
+@db.event.listens_for(Engine, "handle_error")
+def drop_query_timer(context):
+    if context.connection is not None and \
+            context.connection.info.get("query_start"):
+        context.connection.info["query_start"].pop()
+
+
+@db.event.listens_for(Pool, "checkout")
+def count_checkout(dbapi_connection, connection_record, connection_proxy):
+    if query_metrics.enabled:
+        query_metrics.record_checkout()
@@ -0,0 +1,150 @@
+"""VenueArea summary of the venues of each city, kept by triggers
+
+Revision ID: 2b8e6d0f4a93
+Revises: d1e7b3a4c6f2
+Create Date: 2026-10-18 19:03:48.627519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b8e6d0f4a93'
+down_revision = 'd1e7b3a4c6f2'
+branch_labels = None
+depends_on = None
+
+# Mirrors models.SQLITE_VENUE_AREA_REFRESH and models.VENUE_AREA_DDL at the
+# time of this revision.
+SQLITE_VENUE_AREA_REFRESH = """
+    DELETE FROM "VenueArea" WHERE state = {row}.state AND city = {row}.city;
+    INSERT INTO "VenueArea"
+      (state, city, venue_count, upcoming_show_count, venues)
+    SELECT state, city, count(*), sum(upcoming_show_count),
+           json_group_array(json_object(
+             'id', id, 'name', name,
+             'num_upcoming_shows', upcoming_show_count))
+    FROM (SELECT * FROM "Venue"
+          WHERE state = {row}.state AND city = {row}.city ORDER BY id)
+    GROUP BY state, city;"""
+
+VENUE_AREA_DDL = {
+    "postgresql": [
+        """CREATE FUNCTION "VenueArea_refresh_area"(
+             area_state varchar, area_city varchar) RETURNS void
+           LANGUAGE plpgsql AS $$
+           BEGIN
+             PERFORM pg_advisory_xact_lock(hashtext('VenueArea'),
+                                           hashtext(area_state || '/'
+                                                    || area_city));
+             DELETE FROM "VenueArea"
+             WHERE state = area_state AND city = area_city;
+             INSERT INTO "VenueArea"
+               (state, city, venue_count, upcoming_show_count, venues)
+             SELECT state, city, count(*), sum(upcoming_show_count),
+                    json_agg(json_build_object(
+                      'id', id, 'name', name,
+                      'num_upcoming_shows', upcoming_show_count) ORDER BY id)
+             FROM "Venue" WHERE state = area_state AND city = area_city
+             GROUP BY state, city;
+           END $$""",
+        """CREATE FUNCTION "VenueArea_refresh"() RETURNS trigger
+           LANGUAGE plpgsql AS $$
+           BEGIN
+             IF TG_OP = 'INSERT' THEN
+               PERFORM "VenueArea_refresh_area"(state, city) FROM (
+                 SELECT DISTINCT state, city FROM new_rows
+                 ORDER BY state, city) areas;
+             ELSIF TG_OP = 'DELETE' THEN
+               PERFORM "VenueArea_refresh_area"(state, city) FROM (
+                 SELECT DISTINCT state, city FROM old_rows
+                 ORDER BY state, city) areas;
+             ELSE
+               PERFORM "VenueArea_refresh_area"(state, city) FROM (
+                 SELECT DISTINCT area.state, area.city
+                 FROM old_rows o JOIN new_rows n USING (id),
+                      LATERAL (VALUES (o.state, o.city), (n.state, n.city))
+                        AS area (state, city)
+                 WHERE (o.name, o.state, o.city, o.upcoming_show_count)
+                   IS DISTINCT FROM
+                   (n.name, n.state, n.city, n.upcoming_show_count)
+                 ORDER BY area.state, area.city) areas;
+             END IF;
+             RETURN NULL;
+           END $$""",
+        """CREATE TRIGGER "VenueArea_ai" AFTER INSERT ON "Venue"
+           REFERENCING NEW TABLE AS new_rows
+           FOR EACH STATEMENT EXECUTE PROCEDURE "VenueArea_refresh"()""",
+        """CREATE TRIGGER "VenueArea_au" AFTER UPDATE ON "Venue"
+           REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+           FOR EACH STATEMENT EXECUTE PROCEDURE "VenueArea_refresh"()""",
+        """CREATE TRIGGER "VenueArea_ad" AFTER DELETE ON "Venue"
+           REFERENCING OLD TABLE AS old_rows
+           FOR EACH STATEMENT EXECUTE PROCEDURE "VenueArea_refresh"()""",
+    ],
+    "sqlite": [
+        """CREATE TRIGGER "VenueArea_ai" AFTER INSERT ON "Venue" BEGIN"""
+        + SQLITE_VENUE_AREA_REFRESH.format(row="new") + """
+           END""",
+        """CREATE TRIGGER "VenueArea_au" AFTER UPDATE ON "Venue"
+           WHEN old.name IS NOT new.name OR old.state IS NOT new.state
+             OR old.city IS NOT new.city
+             OR old.upcoming_show_count IS NOT new.upcoming_show_count
+           BEGIN"""
+        + SQLITE_VENUE_AREA_REFRESH.format(row="old")
+        + SQLITE_VENUE_AREA_REFRESH.format(row="new") + """
+           END""",
+        """CREATE TRIGGER "VenueArea_ad" AFTER DELETE ON "Venue" BEGIN"""
+        + SQLITE_VENUE_AREA_REFRESH.format(row="old") + """
+           END""",
+    ],
+}
+
+FILL = {
+    'postgresql': """
+        INSERT INTO "VenueArea"
+          (state, city, venue_count, upcoming_show_count, venues)
+        SELECT state, city, count(*), sum(upcoming_show_count),
+               json_agg(json_build_object(
+                 'id', id, 'name', name,
+                 'num_upcoming_shows', upcoming_show_count) ORDER BY id)
+        FROM "Venue" GROUP BY state, city""",
+    'sqlite': """
+        INSERT INTO "VenueArea"
+          (state, city, venue_count, upcoming_show_count, venues)
+        SELECT state, city, count(*), sum(upcoming_show_count),
+               json_group_array(json_object(
+                 'id', id, 'name', name,
+                 'num_upcoming_shows', upcoming_show_count))
+        FROM (SELECT * FROM "Venue" ORDER BY state, city, id)
+        GROUP BY state, city""",
+}
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    op.create_table('VenueArea',
+                    sa.Column('state', sa.String(length=2), nullable=False),
+                    sa.Column('city', sa.String(length=120), nullable=False),
+                    sa.Column('venue_count', sa.Integer(), nullable=False),
+                    sa.Column('upcoming_show_count', sa.Integer(),
+                              nullable=False),
+                    sa.Column('venues', sa.JSON(), nullable=False),
+                    sa.PrimaryKeyConstraint('state', 'city'))
+    for statement in VENUE_AREA_DDL.get(dialect, []):
+        op.execute(statement)
+    if dialect in FILL:
+        op.execute(FILL[dialect])
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for trigger in ('VenueArea_ai', 'VenueArea_au', 'VenueArea_ad'):
+        op.execute('DROP TRIGGER IF EXISTS "{}"{}'.format(
+            trigger, ' ON "Venue"' if dialect == 'postgresql' else ''))
+    if dialect == 'postgresql':
+        op.execute('DROP FUNCTION IF EXISTS "VenueArea_refresh"()')
+        op.execute('DROP FUNCTION IF EXISTS '
+                   '"VenueArea_refresh_area"(varchar, varchar)')
+    op.drop_table('VenueArea')
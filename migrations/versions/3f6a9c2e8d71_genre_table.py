@@ -0,0 +1,160 @@
+"""normalize genres into a Genre lookup table
+
+Revision ID: 3f6a9c2e8d71
+Revises: b94f17c2d5e3
+Create Date: 2026-10-18 17:02:14.530861
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6a9c2e8d71'
+down_revision = 'b94f17c2d5e3'
+branch_labels = None
+depends_on = None
+
+ENTITIES = [('Artist', 'artist_id'), ('Venue', 'venue_id')]
+
+# Mirrors the genre triggers of models.SQLITE_SEARCH_DDL at the time of
+# this revision.
+SQLITE_GENRE_SEARCH_DDL = [
+    """CREATE TRIGGER "{entity}GenreSearch_ai" AFTER INSERT ON "{entity}Genre"
+       BEGIN
+         UPDATE "{entity}Search" SET genres = (
+           SELECT group_concat(g.name, ' ') FROM "{entity}Genre" eg
+           JOIN "Genre" g ON g.id = eg.genre_id
+           WHERE eg.{fk} = new.{fk})
+         WHERE rowid = new.{fk};
+       END""",
+    """CREATE TRIGGER "{entity}GenreSearch_au" AFTER UPDATE ON "{entity}Genre"
+       BEGIN
+         UPDATE "{entity}Search" SET genres = (
+           SELECT group_concat(g.name, ' ') FROM "{entity}Genre" eg
+           JOIN "Genre" g ON g.id = eg.genre_id
+           WHERE eg.{fk} = "{entity}Search".rowid)
+         WHERE rowid IN (old.{fk}, new.{fk});
+       END""",
+    """CREATE TRIGGER "{entity}GenreSearch_ad" AFTER DELETE ON "{entity}Genre"
+       BEGIN
+         UPDATE "{entity}Search" SET genres = (
+           SELECT group_concat(g.name, ' ') FROM "{entity}Genre" eg
+           JOIN "Genre" g ON g.id = eg.genre_id
+           WHERE eg.{fk} = old.{fk})
+         WHERE rowid = old.{fk};
+       END""",
+]
+
+# The genre triggers of revision e81b4d6f2c90, restored on downgrade.
+SQLITE_GENRE_NAME_SEARCH_DDL = [
+    """CREATE TRIGGER "{entity}GenreSearch_ai" AFTER INSERT ON "{entity}Genre"
+       BEGIN
+         UPDATE "{entity}Search" SET genres = (
+           SELECT group_concat(genre, ' ') FROM "{entity}Genre"
+           WHERE {fk} = new.{fk})
+         WHERE rowid = new.{fk};
+       END""",
+    """CREATE TRIGGER "{entity}GenreSearch_au" AFTER UPDATE ON "{entity}Genre"
+       BEGIN
+         UPDATE "{entity}Search" SET genres = (
+           SELECT group_concat(genre, ' ') FROM "{entity}Genre"
+           WHERE {fk} = "{entity}Search".rowid)
+         WHERE rowid IN (old.{fk}, new.{fk});
+       END""",
+    """CREATE TRIGGER "{entity}GenreSearch_ad" AFTER DELETE ON "{entity}Genre"
+       BEGIN
+         UPDATE "{entity}Search" SET genres = (
+           SELECT group_concat(genre, ' ') FROM "{entity}Genre"
+           WHERE {fk} = old.{fk})
+         WHERE rowid = old.{fk};
+       END""",
+]
+
+
+def drop_genre_triggers(entity):
+    for trigger in ('GenreSearch_ai', 'GenreSearch_au', 'GenreSearch_ad'):
+        op.execute('DROP TRIGGER IF EXISTS "{}{}"'.format(entity, trigger))
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    op.create_table('Genre',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('name', sa.String(length=30), nullable=False),
+                    sa.PrimaryKeyConstraint('id'),
+                    sa.UniqueConstraint('name'))
+    op.execute(
+        'INSERT INTO "Genre" (name) '
+        'SELECT genre FROM "ArtistGenre" UNION SELECT genre FROM "VenueGenre" '
+        'ORDER BY 1')
+
+    # Rebuild each association table keyed by (entity, genre) rather than
+    # altering it in place, which SQLite cannot do.
+    for entity, fk in ENTITIES:
+        table = entity + 'Genre'
+        op.create_table(table + '_new',
+                        sa.Column(fk, sa.Integer(), nullable=False),
+                        sa.Column('genre_id', sa.Integer(), nullable=False),
+                        sa.ForeignKeyConstraint([fk], [entity + '.id']),
+                        sa.ForeignKeyConstraint(['genre_id'], ['Genre.id']),
+                        sa.PrimaryKeyConstraint(fk, 'genre_id'))
+        op.execute(
+            'INSERT INTO "{table}_new" ({fk}, genre_id) '
+            'SELECT DISTINCT eg.{fk}, g.id FROM "{table}" eg '
+            'JOIN "Genre" g ON g.name = eg.genre '
+            'WHERE eg.{fk} IS NOT NULL'.format(table=table, fk=fk))
+        if dialect == 'sqlite':
+            drop_genre_triggers(entity)
+        op.drop_table(table)
+        op.rename_table(table + '_new', table)
+        if dialect == 'postgresql':
+            op.execute('ALTER INDEX "{0}_new_pkey" RENAME TO "{0}_pkey"'
+                       .format(table))
+        op.create_index('ix_{}_genre_id_{}'.format(table, fk), table,
+                        ['genre_id', fk])
+        if dialect == 'sqlite':
+            for statement in SQLITE_GENRE_SEARCH_DDL:
+                op.execute(statement.format(entity=entity, fk=fk))
+            # Duplicate genres were dropped above.
+            op.execute(
+                'UPDATE "{entity}Search" SET genres = coalesce(('
+                'SELECT group_concat(g.name, \' \') FROM "{entity}Genre" eg '
+                'JOIN "Genre" g ON g.id = eg.genre_id '
+                'WHERE eg.{fk} = "{entity}Search".rowid), \'\')'
+                .format(entity=entity, fk=fk))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for entity, fk in ENTITIES:
+        table = entity + 'Genre'
+        op.create_table(table + '_old',
+                        sa.Column('id', sa.Integer(), nullable=False),
+                        sa.Column(fk, sa.Integer(), nullable=True),
+                        sa.Column('genre', sa.String(length=30),
+                                  nullable=False),
+                        sa.ForeignKeyConstraint([fk], [entity + '.id']),
+                        sa.PrimaryKeyConstraint('id'))
+        op.execute(
+            'INSERT INTO "{table}_old" ({fk}, genre) '
+            'SELECT eg.{fk}, g.name FROM "{table}" eg '
+            'JOIN "Genre" g ON g.id = eg.genre_id '
+            'ORDER BY eg.{fk}, g.name'.format(table=table, fk=fk))
+        if dialect == 'sqlite':
+            drop_genre_triggers(entity)
+        op.drop_table(table)
+        op.rename_table(table + '_old', table)
+        if dialect == 'postgresql':
+            op.execute('ALTER INDEX "{0}_old_pkey" RENAME TO "{0}_pkey"'
+                       .format(table))
+            op.execute('ALTER SEQUENCE "{0}_old_id_seq" RENAME TO "{0}_id_seq"'
+                       .format(table))
+            op.create_index('ix_{}_genre_trgm'.format(table), table,
+                            ['genre'], postgresql_using='gin',
+                            postgresql_ops={'genre': 'gin_trgm_ops'})
+        op.create_index('ix_{}_{}'.format(table, fk), table, [fk])
+        if dialect == 'sqlite':
+            for statement in SQLITE_GENRE_NAME_SEARCH_DDL:
+                op.execute(statement.format(entity=entity, fk=fk))
+    op.drop_table('Genre')
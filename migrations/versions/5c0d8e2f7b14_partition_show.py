@@ -0,0 +1,95 @@
+"""partition Show by month of start_time on Postgres
+
+Revision ID: 5c0d8e2f7b14
+Revises: 2b8e6d0f4a93
+Create Date: 2026-10-18 19:40:12.318825
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c0d8e2f7b14'
+down_revision = '2b8e6d0f4a93'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_Show_start_time_id', ['start_time', 'id']),
+    ('ix_Show_venue_id_start_time', ['venue_id', 'start_time']),
+    ('ix_Show_artist_id_start_time', ['artist_id', 'start_time']),
+]
+
+# Months of partitions created ahead of the current one; later months go to
+# the default partition until `flask partition-shows` creates theirs.
+AHEAD = 12
+
+SHOW_COLUMNS = """
+    id integer NOT NULL DEFAULT nextval('"Show_id_seq"'::regclass),
+    artist_id integer NOT NULL,
+    venue_id integer NOT NULL,
+    start_time timestamp without time zone NOT NULL,
+    CONSTRAINT "Show_artist_id_fkey" FOREIGN KEY (artist_id)
+      REFERENCES "Artist" (id) ON DELETE CASCADE,
+    CONSTRAINT "Show_venue_id_fkey" FOREIGN KEY (venue_id)
+      REFERENCES "Venue" (id) ON DELETE CASCADE"""
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def set_aside_show_table():
+    """Rename "Show" out of the way of its replacement."""
+    op.execute('ALTER TABLE "Show" RENAME TO "Show_old"')
+    op.execute('ALTER INDEX "Show_pkey" RENAME TO "Show_old_pkey"')
+    for name, _ in INDEXES:
+        op.drop_index(name, table_name='Show_old')
+
+
+def move_show_rows():
+    """Copy the rows set aside into the new "Show" and drop the old table,
+    keeping the id sequence."""
+    op.execute('INSERT INTO "Show" (id, artist_id, venue_id, start_time) '
+               'SELECT id, artist_id, venue_id, start_time FROM "Show_old"')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+    op.drop_table('Show_old')
+    for name, columns in INDEXES:
+        op.create_index(name, 'Show', columns)
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+    set_aside_show_table()
+    op.execute('CREATE TABLE "Show" ({}, PRIMARY KEY (id, start_time)) '
+               'PARTITION BY RANGE (start_time)'.format(SHOW_COLUMNS))
+    op.execute('CREATE TABLE "Show_default" PARTITION OF "Show" DEFAULT')
+
+    # One partition per month from now to AHEAD months ahead, and per
+    # earlier month that has shows.
+    today = datetime.now()
+    months = {add_months(datetime(today.year, today.month, 1), n)
+              for n in range(AHEAD + 1)}
+    months.update(month for month, in bind.execute(sa.text(
+        "SELECT DISTINCT date_trunc('month', start_time) FROM \"Show_old\" "
+        "WHERE start_time < :first"), first=min(months)))
+    for month in sorted(months):
+        op.execute(
+            'CREATE TABLE "Show_p{:%Y%m}" PARTITION OF "Show" '
+            "FOR VALUES FROM ('{:%Y-%m-%d}') TO ('{:%Y-%m-%d}')"
+            .format(month, month, add_months(month, 1)))
+    move_show_rows()
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    set_aside_show_table()
+    op.execute('CREATE TABLE "Show" ({}, PRIMARY KEY (id))'
+               .format(SHOW_COLUMNS))
+    move_show_rows()
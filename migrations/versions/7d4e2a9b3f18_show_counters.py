@@ -0,0 +1,44 @@
+"""upcoming and past show counters on Venue and Artist
+
+Revision ID: 7d4e2a9b3f18
+Revises: e81b4d6f2c90
+Create Date: 2026-10-18 13:40:08.671520
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d4e2a9b3f18'
+down_revision = 'e81b4d6f2c90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The app splits upcoming and past shows at its local datetime.now()
+    # (models.request_now()), and start_time holds local times; the
+    # database's CURRENT_TIMESTAMP is in UTC on SQLite.
+    now = sa.bindparam('now', datetime.now(), type_=sa.DateTime())
+    for table, fk in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.add_column(table, sa.Column('upcoming_show_count', sa.Integer(),
+                                       nullable=False, server_default='0'))
+        op.add_column(table, sa.Column('past_show_count', sa.Integer(),
+                                       nullable=False, server_default='0'))
+        op.execute(sa.text(
+            'UPDATE "{table}" SET '
+            'upcoming_show_count = (SELECT count(*) FROM "Show" '
+            'WHERE "Show".{fk} = "{table}".id '
+            'AND "Show".start_time >= :now), '
+            'past_show_count = (SELECT count(*) FROM "Show" '
+            'WHERE "Show".{fk} = "{table}".id '
+            'AND "Show".start_time < :now)'
+            .format(table=table, fk=fk)).bindparams(now))
+
+
+def downgrade():
+    for table in ('Venue', 'Artist'):
+        op.drop_column(table, 'past_show_count')
+        op.drop_column(table, 'upcoming_show_count')
@@ -0,0 +1,27 @@
+"""version columns on Artist and Venue for optimistic concurrency
+
+Revision ID: 8c2f5a71e0d4
+Revises: 3f6a9c2e8d71
+Create Date: 2026-10-18 17:48:05.114203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c2f5a71e0d4'
+down_revision = '3f6a9c2e8d71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Artist', 'Venue'):
+        op.add_column(table, sa.Column('version', sa.Integer(),
+                                       nullable=False, server_default='1'))
+
+
+def downgrade():
+    for table in ('Venue', 'Artist'):
+        op.drop_column(table, 'version')
@@ -0,0 +1,43 @@
+"""duration of shows, for the booking conflict check
+
+Revision ID: 9f4a6c2e1d57
+Revises: 5c0d8e2f7b14
+Create Date: 2026-10-18 20:47:05.912364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f4a6c2e1d57'
+down_revision = '5c0d8e2f7b14'
+branch_labels = None
+depends_on = None
+
+# Mirrors models.DEFAULT_SHOW_DURATION and models.MAX_SHOW_DURATION at the
+# time of this revision.
+DEFAULT_SHOW_DURATION = 120
+MAX_SHOW_DURATION = 24 * 60
+
+
+def upgrade():
+    # Batch mode rebuilds the table on SQLite, which cannot add a CHECK
+    # constraint in place; on Postgres both statements apply to every
+    # partition.
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.add_column(sa.Column(
+            'duration', sa.Integer(), nullable=False,
+            server_default=str(DEFAULT_SHOW_DURATION)))
+        batch_op.create_check_constraint(
+            'ck_Show_duration',
+            'duration BETWEEN 1 AND {}'.format(MAX_SHOW_DURATION))
+
+
+def downgrade():
+    with op.batch_alter_table('Show') as batch_op:
+        # SQLite CHECK constraints are not reflected, so the rebuilt table
+        # leaves it out without being told to.
+        if op.get_bind().dialect.name != 'sqlite':
+            batch_op.drop_constraint('ck_Show_duration', type_='check')
+        batch_op.drop_column('duration')
@@ -0,0 +1,24 @@
+"""index Show on (start_time, id) for keyset pagination
+
+Revision ID: a3c81f0e5b27
+Revises: 754b9d76dd54
+Create Date: 2026-10-18 09:12:40.512331
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c81f0e5b27'
+down_revision = '754b9d76dd54'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Show_start_time_id', 'Show', ['start_time', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_Show_start_time_id', table_name='Show')
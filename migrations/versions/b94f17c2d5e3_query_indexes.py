@@ -0,0 +1,35 @@
+"""indexes for the joins, filters and sorts issued by the models
+
+Revision ID: b94f17c2d5e3
+Revises: 7d4e2a9b3f18
+Create Date: 2026-10-18 14:55:31.208746
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b94f17c2d5e3'
+down_revision = '7d4e2a9b3f18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Show_venue_id_start_time', 'Show',
+                    ['venue_id', 'start_time'])
+    op.create_index('ix_Show_artist_id_start_time', 'Show',
+                    ['artist_id', 'start_time'])
+    op.create_index('ix_ArtistGenre_artist_id', 'ArtistGenre', ['artist_id'])
+    op.create_index('ix_VenueGenre_venue_id', 'VenueGenre', ['venue_id'])
+    op.create_index('ix_Venue_state_city_id', 'Venue',
+                    ['state', 'city', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_Venue_state_city_id', table_name='Venue')
+    op.drop_index('ix_VenueGenre_venue_id', table_name='VenueGenre')
+    op.drop_index('ix_ArtistGenre_artist_id', table_name='ArtistGenre')
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
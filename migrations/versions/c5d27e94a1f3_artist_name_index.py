@@ -0,0 +1,24 @@
+"""index Artist on (name, id) for the alphabetical listing
+
+Revision ID: c5d27e94a1f3
+Revises: a3c81f0e5b27
+Create Date: 2026-10-18 10:03:17.284905
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d27e94a1f3'
+down_revision = 'a3c81f0e5b27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Artist_name_id', 'Artist', ['name', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_Artist_name_id', table_name='Artist')
@@ -0,0 +1,88 @@
+"""ON DELETE CASCADE on the foreign keys to Artist and Venue
+
+Revision ID: d1e7b3a4c6f2
+Revises: 8c2f5a71e0d4
+Create Date: 2026-10-18 18:21:37.402816
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1e7b3a4c6f2'
+down_revision = '8c2f5a71e0d4'
+branch_labels = None
+depends_on = None
+
+# (table, column, referred table)
+FOREIGN_KEYS = [
+    ('Show', 'venue_id', 'Venue'),
+    ('Show', 'artist_id', 'Artist'),
+    ('VenueGenre', 'venue_id', 'Venue'),
+    ('ArtistGenre', 'artist_id', 'Artist'),
+]
+
+# Lets batch mode address the unnamed foreign keys of SQLite tables.
+NAMING_CONVENTION = {'fk': '%(table_name)s_%(column_0_name)s_fkey'}
+
+# Mirrors the genre triggers of models.SQLITE_SEARCH_DDL at the time of
+# this revision; SQLite drops them when batch mode rebuilds the table.
+SQLITE_GENRE_SEARCH_DDL = [
+    """CREATE TRIGGER "{entity}GenreSearch_ai" AFTER INSERT ON "{entity}Genre"
+       BEGIN
+         UPDATE "{entity}Search" SET genres = (
+           SELECT group_concat(g.name, ' ') FROM "{entity}Genre" eg
+           JOIN "Genre" g ON g.id = eg.genre_id
+           WHERE eg.{fk} = new.{fk})
+         WHERE rowid = new.{fk};
+       END""",
+    """CREATE TRIGGER "{entity}GenreSearch_au" AFTER UPDATE ON "{entity}Genre"
+       BEGIN
+         UPDATE "{entity}Search" SET genres = (
+           SELECT group_concat(g.name, ' ') FROM "{entity}Genre" eg
+           JOIN "Genre" g ON g.id = eg.genre_id
+           WHERE eg.{fk} = "{entity}Search".rowid)
+         WHERE rowid IN (old.{fk}, new.{fk});
+       END""",
+    """CREATE TRIGGER "{entity}GenreSearch_ad" AFTER DELETE ON "{entity}Genre"
+       BEGIN
+         UPDATE "{entity}Search" SET genres = (
+           SELECT group_concat(g.name, ' ') FROM "{entity}Genre" eg
+           JOIN "Genre" g ON g.id = eg.genre_id
+           WHERE eg.{fk} = old.{fk})
+         WHERE rowid = old.{fk};
+       END""",
+]
+
+
+def replace_foreign_keys(ondelete):
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    for table, column, referred in FOREIGN_KEYS:
+        name = None
+        for fk in inspector.get_foreign_keys(table):
+            if fk['constrained_columns'] == [column]:
+                name = fk['name']
+        with op.batch_alter_table(
+                table, naming_convention=NAMING_CONVENTION) as batch_op:
+            batch_op.drop_constraint(
+                name or '{}_{}_fkey'.format(table, column),
+                type_='foreignkey')
+            batch_op.create_foreign_key(
+                '{}_{}_fkey'.format(table, column), referred, [column],
+                ['id'], ondelete=ondelete)
+        if bind.dialect.name == 'sqlite' and table.endswith('Genre'):
+            entity = table[:-len('Genre')]
+            for statement in SQLITE_GENRE_SEARCH_DDL:
+                op.execute('DROP TRIGGER IF EXISTS "{}"'.format(
+                    statement.split('"')[1].format(entity=entity)))
+                op.execute(statement.format(entity=entity, fk=column))
+
+
+def upgrade():
+    replace_foreign_keys('CASCADE')
+
+
+def downgrade():
+    replace_foreign_keys(None)
@@ -0,0 +1,97 @@
+"""search indexes for Venue and Artist
+
+Revision ID: e81b4d6f2c90
+Revises: c5d27e94a1f3
+Create Date: 2026-10-18 11:26:52.903114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e81b4d6f2c90'
+down_revision = 'c5d27e94a1f3'
+branch_labels = None
+depends_on = None
+
+TRIGRAM_INDEXES = [
+    ('ix_Venue_name_trgm', 'Venue', 'name'),
+    ('ix_Venue_city_trgm', 'Venue', 'city'),
+    ('ix_VenueGenre_genre_trgm', 'VenueGenre', 'genre'),
+    ('ix_Artist_name_trgm', 'Artist', 'name'),
+    ('ix_Artist_city_trgm', 'Artist', 'city'),
+    ('ix_ArtistGenre_genre_trgm', 'ArtistGenre', 'genre'),
+]
+
+# Mirrors models.SQLITE_SEARCH_DDL at the time of this revision.
+SQLITE_SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE "{entity}Search"
+       USING fts5(name, city, genres, tokenize='trigram')""",
+    """CREATE TRIGGER "{entity}Search_ai" AFTER INSERT ON "{entity}" BEGIN
+         INSERT INTO "{entity}Search" (rowid, name, city, genres)
+         VALUES (new.id, new.name, new.city, '');
+       END""",
+    """CREATE TRIGGER "{entity}Search_au" AFTER UPDATE ON "{entity}" BEGIN
+         UPDATE "{entity}Search" SET name = new.name, city = new.city
+         WHERE rowid = new.id;
+       END""",
+    """CREATE TRIGGER "{entity}Search_ad" AFTER DELETE ON "{entity}" BEGIN
+         DELETE FROM "{entity}Search" WHERE rowid = old.id;
+       END""",
+    """CREATE TRIGGER "{entity}GenreSearch_ai" AFTER INSERT ON "{entity}Genre"
+       BEGIN
+         UPDATE "{entity}Search" SET genres = (
+           SELECT group_concat(genre, ' ') FROM "{entity}Genre"
+           WHERE {fk} = new.{fk})
+         WHERE rowid = new.{fk};
+       END""",
+    """CREATE TRIGGER "{entity}GenreSearch_au" AFTER UPDATE ON "{entity}Genre"
+       BEGIN
+         UPDATE "{entity}Search" SET genres = (
+           SELECT group_concat(genre, ' ') FROM "{entity}Genre"
+           WHERE {fk} = "{entity}Search".rowid)
+         WHERE rowid IN (old.{fk}, new.{fk});
+       END""",
+    """CREATE TRIGGER "{entity}GenreSearch_ad" AFTER DELETE ON "{entity}Genre"
+       BEGIN
+         UPDATE "{entity}Search" SET genres = (
+           SELECT group_concat(genre, ' ') FROM "{entity}Genre"
+           WHERE {fk} = old.{fk})
+         WHERE rowid = old.{fk};
+       END""",
+]
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for name, table, column in TRIGRAM_INDEXES:
+            op.create_index(name, table, [column], postgresql_using='gin',
+                            postgresql_ops={column: 'gin_trgm_ops'})
+    elif dialect == 'sqlite':
+        for entity, fk in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+            for statement in SQLITE_SEARCH_DDL:
+                op.execute(statement.format(entity=entity, fk=fk))
+            op.execute(
+                'INSERT INTO "{entity}Search" (rowid, name, city, genres) '
+                'SELECT e.id, e.name, e.city, coalesce(('
+                'SELECT group_concat(genre, \' \') FROM "{entity}Genre" '
+                'WHERE {fk} = e.id), \'\') FROM "{entity}" e'
+                .format(entity=entity, fk=fk))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for name, table, column in TRIGRAM_INDEXES:
+            op.drop_index(name, table_name=table)
+    elif dialect == 'sqlite':
+        for entity in ('Venue', 'Artist'):
+            for trigger in ('Search_ai', 'Search_au', 'Search_ad'):
+                op.execute('DROP TRIGGER "{}{}"'.format(entity, trigger))
+            for trigger in ('GenreSearch_ai', 'GenreSearch_au',
+                            'GenreSearch_ad'):
+                op.execute('DROP TRIGGER "{}{}"'.format(entity, trigger))
+            op.execute('DROP TABLE "{}Search"'.format(entity))
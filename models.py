@@ -1,27 +1,225 @@
-from flask import Flask
+from flask import g, has_request_context
+from sqlalchemy.engine import Engine
 from sqlalchemy.exc import DBAPIError, SQLAlchemyError
-from flask_sqlalchemy import SQLAlchemy
-from flask_moment import Moment
-from flask_migrate import Migrate
+from sqlalchemy.orm.exc import StaleDataError
 from dataclasses import dataclass
 from typing import List
-from datetime import datetime
+from replicas import RoutingSQLAlchemy
+from datetime import datetime, timedelta
+import base64
+import bisect
+import binascii
+import json
+import sqlite3
 
 # ----------------------------------------------------------------------------#
 # App Config.
 # ----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+# Bound to the application by app.create_app(). Its sessions route the
+# queries of read-only views to the read replicas; see replicas.py.
+db = RoutingSQLAlchemy()
+
+# ----------------------------------------------------------------------------#
+# Helpers.
+# ----------------------------------------------------------------------------#
+
+
+@db.event.listens_for(Engine, "connect")
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """SQLite only enforces foreign keys, and their ON DELETE CASCADE
+    actions, when asked to on each connection."""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys = ON")
+        cursor.close()
+
+
+def request_now():
+    """Return one timestamp per request, so that all queries issued while
+    handling it split upcoming and past shows at the same instant."""
+    if not has_request_context():
+        return datetime.now()
+    if "now" not in g:
+        g.now = datetime.now()
+    return g.now
+
+
+def encode_cursor(*values):
+    """Encode the sort key of a row as an opaque, URL-safe page cursor."""
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime)
+                      else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Decode a cursor made by encode_cursor. Raises ValueError if the
+    cursor was tampered with."""
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError("Invalid page cursor") from e
+
+
+def cursor_value(key, value):
+    """Convert a value decoded from a cursor to the type of the `key`
+    column. Raises ValueError if it does not have that type."""
+    python_type = key.type.python_type
+    if python_type is datetime:
+        try:
+            return datetime.fromisoformat(value)
+        except TypeError as e:
+            raise ValueError("Invalid page cursor") from e
+    # bool is an int, but no key is a boolean column.
+    if not isinstance(value, python_type) or isinstance(value, bool):
+        raise ValueError("Invalid page cursor")
+    return value
+
+
+def keyset_page(query, keys, after=None, before=None, per_page=30):
+    """Fetch one page of `query` ordered by the `keys` columns.
+
+    Pages are addressed by cursors holding the keys of the row just outside
+    the page rather than by offsets, so with an index on `keys` every page
+    is a short range scan no matter how deep into the listing it is.
+    Returns the rows with the cursors of the previous and next page, which
+    are None at either end of the listing.
+    """
+    def bound(cursor):
+        values = decode_cursor(cursor)
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError("Invalid page cursor")
+        return db.tuple_(*[cursor_value(key, value)
+                           for key, value in zip(keys, values)])
+
+    def cursor(row):
+        return encode_cursor(*[getattr(row, key.key) for key in keys])
+
+    if before is not None:
+        qrRes = query \
+            .filter(db.tuple_(*keys) < bound(before)) \
+            .order_by(*[key.desc() for key in keys]) \
+            .limit(per_page + 1).all()
+        has_prev = len(qrRes) > per_page
+        has_next = True
+        qrRes = qrRes[:per_page][::-1]
+    else:
+        if after is not None:
+            query = query.filter(db.tuple_(*keys) > bound(after))
+        qrRes = query.order_by(*keys).limit(per_page + 1).all()
+        has_prev = after is not None
+        has_next = len(qrRes) > per_page
+        qrRes = qrRes[:per_page]
+
+    if not qrRes:
+        return qrRes, None, None
+    return (qrRes,
+            cursor(qrRes[0]) if has_prev else None,
+            cursor(qrRes[-1]) if has_next else None)
+
+
+def iter_keyset(query, keys, batch_size=500):
+    """Yield every row of `query` in `keys` order, fetching it in keyset
+    pages of `batch_size` rows so that only one page is in memory."""
+    after = None
+    while True:
+        qrRes, _, after = keyset_page(query, keys, after, None, batch_size)
+        yield from qrRes
+        if after is None:
+            return
+
+
+# Detail fields that need the entity's shows to be queried, and those of
+# them that need its past shows too.
+SHOW_DETAIL_FIELDS = frozenset([
+    "upcoming_shows", "upcoming_shows_count", "past_shows", "past_shows_count"
+])
+PAST_SHOW_DETAIL_FIELDS = frozenset(["past_shows", "past_shows_count"])
+
+# Show durations, in minutes. The cap bounds how long before a new show an
+# overlapping one can start; see find_booking_conflict().
+DEFAULT_SHOW_DURATION = 120
+MAX_SHOW_DURATION = 24 * 60
+
+# Fields that the listings of each entity can select, by default all.
+LISTING_FIELDS = {
+    "Artist": ("id", "name", "city", "state", "phone", "website",
+               "facebook_link", "image_link", "seeking_venue",
+               "seeking_description", "upcoming_show_count",
+               "past_show_count"),
+    "Venue": ("id", "name", "address", "city", "state", "phone", "website",
+              "facebook_link", "image_link", "seeking_talent",
+              "seeking_description", "upcoming_show_count",
+              "past_show_count"),
+    "Show": ("id", "start_time", "duration", "venue_id", "venue_name",
+             "artist_id", "artist_name", "artist_image_link"),
+}
+
+# Columns the edit forms can change.
+EDITABLE_FIELDS = {
+    "Artist": ("name", "city", "state", "phone", "website", "facebook_link",
+               "image_link"),
+    "Venue": ("name", "city", "state", "address", "phone", "website",
+              "facebook_link", "image_link"),
+}
+
 
 # ----------------------------------------------------------------------------#
 # Models.
 # ----------------------------------------------------------------------------#
 
 
+@dataclass
+class Genre(db.Model):
+    __tablename__ = "Genre"
+    id: int = db.Column(db.Integer, primary_key=True)
+    name: str = db.Column(db.String(30), nullable=False, unique=True)
+
+    @staticmethod
+    def named(names):
+        """Return the genres called `names`, in name order, adding the ones
+        that do not exist yet to the session."""
+        names = sorted(set(names))
+        if not names:
+            return []
+        genres = {genre.name: genre for genre in
+                  Genre.query.filter(Genre.name.in_(names))}
+        for name in names:
+            if name not in genres:
+                genres[name] = Genre(name=name)
+                db.session.add(genres[name])
+        return [genres[name] for name in names]
+
+    @staticmethod
+    def ids(names):
+        """Map each of `names` to its genre id, inserting missing genres."""
+        genres = Genre.named(names)
+        db.session.flush()
+        return {genre.name: genre.id for genre in genres}
+
+    @staticmethod
+    def id_of(name):
+        """Return the id of the genre called `name`, or None."""
+        return db.session.query(Genre.id).filter(Genre.name == name).scalar()
+
+    @staticmethod
+    def listing():
+        """Return every genre with its number of artists and venues. The
+        counts are index-only scans of the (genre_id, ...) indexes."""
+        artists = dict(db.session.query(ArtistGenre.genre_id,
+                                        db.func.count())
+                       .group_by(ArtistGenre.genre_id))
+        venues = dict(db.session.query(VenueGenre.genre_id, db.func.count())
+                      .group_by(VenueGenre.genre_id))
+        return [{
+            "id": genre.id,
+            "name": genre.name,
+            "artists": artists.get(genre.id, 0),
+            "venues": venues.get(genre.id, 0)
+        } for genre in db.session.query(Genre.id, Genre.name)
+            .order_by(Genre.name)]
+
+
 @dataclass
 class Artist(db.Model):
     __tablename__ = "Artist"
@@ -38,17 +236,33 @@ class Artist(db.Model):
     seeking_venue: bool = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description: str = db.Column(db.String(120), nullable=False,
                                          default="")
-    genres: List[str] = db.relationship("ArtistGenre", backref="artist")
+    upcoming_show_count: int = db.Column(db.Integer, nullable=False,
+                                         default=0, server_default="0")
+    past_show_count: int = db.Column(db.Integer, nullable=False, default=0,
+                                     server_default="0")
+    version: int = db.Column(db.Integer, nullable=False, default=1,
+                             server_default="1")
+    genres: List[str] = db.relationship("Genre", secondary="ArtistGenre",
+                                        order_by="Genre.name",
+                                        passive_deletes=True)
     venues: List[str] = db.relationship("Show", back_populates="artist")
 
+    __table_args__ = (
+        db.Index("ix_Artist_name_id", "name", "id"),
+    )
+    __mapper_args__ = {"version_id_col": version}
+
     @property
     def details(self):
-        upcoming_shows = [show for show in self.shows
-                          if show.start_time >= datetime.now()]
-        past_shows = [show for show in self.shows
-                      if show.start_time < datetime.now()]
+        return self.select_details()
 
-        return {
+    def select_details(self, fields=None):
+        """Return the detail payload, restricted to `fields` if given.
+
+        Genres and shows are only queried when a field that needs them is
+        selected.
+        """
+        res = {
             "id": self.id,
             "name": self.name,
             "city": self.city,
@@ -59,23 +273,45 @@ class Artist(db.Model):
             "image_link": self.image_link,
             "seeking_venue": self.seeking_venue,
             "seeking_description": self.seeking_description,
-            "genres": [x.genre for x in self.genres],
-            "venues": self.venues,
-            "upcoming_shows_count": len(upcoming_shows),
-            "upcoming_shows": [{
-                "venue_id": show.venue_id,
-                "venue_name": show.venue.name,
-                "venue_image_link": show.venue.image_link,
-                "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S')}
-                for show in upcoming_shows],
-            "past_shows_count": len(past_shows),
-            "past_shows": [{
-                "venue_id": show.venue_id,
-                "venue_name": show.venue.name,
-                "venue_image_link": show.venue.image_link,
-                "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S')}
-                for show in past_shows]
+            "version": self.version
         }
+        if fields is None or "genres" in fields:
+            res["genres"] = [genre.name for genre in self.genres]
+        if fields is None or not SHOW_DETAIL_FIELDS.isdisjoint(fields):
+            now = request_now()
+            shows = db.session.query(
+                Show.venue_id, Venue.name.label("venue_name"),
+                Venue.image_link.label("venue_image_link"), Show.start_time,
+                (Show.start_time >= now).label("upcoming")) \
+                .join(Venue, Venue.id == Show.venue_id) \
+                .filter(Show.artist_id == self.id)
+            # Without past shows, only the partitions of upcoming shows are
+            # read on Postgres.
+            if fields is not None and \
+                    PAST_SHOW_DETAIL_FIELDS.isdisjoint(fields):
+                shows = shows.filter(Show.start_time >= now)
+            shows = shows.order_by(Show.start_time, Show.id).all()
+            upcoming_shows = [show for show in shows if show.upcoming]
+            past_shows = [show for show in shows if not show.upcoming]
+            res.update({
+                "upcoming_shows_count": len(upcoming_shows),
+                "upcoming_shows": [{
+                    "venue_id": show.venue_id,
+                    "venue_name": show.venue_name,
+                    "venue_image_link": show.venue_image_link,
+                    "start_time": show.start_time}
+                    for show in upcoming_shows],
+                "past_shows_count": len(past_shows),
+                "past_shows": [{
+                    "venue_id": show.venue_id,
+                    "venue_name": show.venue_name,
+                    "venue_image_link": show.venue_image_link,
+                    "start_time": show.start_time}
+                    for show in past_shows]
+            })
+        if fields is not None:
+            res = {key: value for key, value in res.items() if key in fields}
+        return res
 
     @staticmethod
     def create(artistRequest):
@@ -84,11 +320,10 @@ class Artist(db.Model):
             city=artistRequest.city.data,
             state=artistRequest.state.data,
             phone=artistRequest.phone.data,
-            website=artistRequest.website.data,
-            facebook_link=artistRequest.facebook_link.data,
-            image_link=artistRequest.image_link.data,
-            genres=[ArtistGenre(genre=genre)
-                    for genre in artistRequest.genres.data]
+            website=form_data(Artist, "website", artistRequest),
+            facebook_link=form_data(Artist, "facebook_link", artistRequest),
+            image_link=form_data(Artist, "image_link", artistRequest),
+            genres=Genre.named(artistRequest.genres.data)
         )
 
         try:
@@ -105,53 +340,84 @@ class Artist(db.Model):
 
     @staticmethod
     def delete(id: int):
-        try:
-            artist = Artist.query.get(id)
-            db.session.delete(artist)
-            db.session.commit()
-        except (DBAPIError, SQLAlchemyError) as e:
-            db.session.rollback()
-            raise e
-        finally:
-            db.session.close()
+        """Delete the artist; see delete_cascading()."""
+        return delete_cascading(Artist, Show.artist_id, Venue, Show.venue_id,
+                                id)
 
     @staticmethod
-    def find(id: int):
+    def calendar(id: int, start: datetime, end: datetime):
+        """The artist's shows in [`start`, `end`); see show_calendar().
+        Returns None if there is no such artist."""
+        if db.session.query(Artist.id).filter(Artist.id == id).first() is None:
+            return None
+        return show_calendar(start, end, Show.artist_id == id)
+
+    @staticmethod
+    def find(id: int, fields=None):
         artist = Artist.query.get(id)
         if artist is None:
             return None
         else:
-            return artist.details
+            return artist.select_details(fields)
+
+    @staticmethod
+    def listing(fields=LISTING_FIELDS["Artist"], genre_id=None):
+        """Yield every artist as a dict of the selected columns, in id order,
+        holding one keyset page of rows in memory at a time. `genre_id`
+        restricts the listing to one genre through
+        ix_ArtistGenre_genre_id_artist_id."""
+        columns = [getattr(Artist, field) for field in fields
+                   if field != "id"]
+        query = db.session.query(Artist.id, *columns)
+        if genre_id is not None:
+            query = query \
+                .join(ArtistGenre, ArtistGenre.artist_id == Artist.id) \
+                .filter(ArtistGenre.genre_id == genre_id)
+        for row in iter_keyset(query, (Artist.id,)):
+            yield {field: getattr(row, field) for field in fields}
 
     @staticmethod
     def update(id: int, artistRequest):
-        artist = Artist.query.get(id)
-        artist.name = artistRequest.name.data,
-        artist.city = artistRequest.city.data,
-        artist.state = artistRequest.state.data,
-        artist.phone = artistRequest.phone.data,
-        artist.website = artistRequest.website.data,
-        artist.facebook_link = artistRequest.facebook_link.data,
-        artist.image_link = artistRequest.image_link.data,
-        artist.genres = [ArtistGenre(genre=genre)
-                         for genre in artistRequest.genres.data]
+        """Save the edits in `artistRequest`; see update_changed()."""
+        return update_changed(Artist, ArtistGenre.artist_id, id, artistRequest,
+                              EDITABLE_FIELDS["Artist"])
 
-        db.session.commit()
+    @staticmethod
+    def page(after=None, before=None, per_page=50, letter=None):
+        """Return one page of artist ids and names in alphabetical order.
+
+        Only the two columns the listing shows are selected. `letter` jumps
+        to the first artist whose name sorts at or after it, which is a
+        range seek on ix_Artist_name_id.
+        """
+        query = db.session.query(Artist.id, Artist.name)
+        if letter is not None:
+            if len(letter) != 1 or not letter.isalpha():
+                raise ValueError("Invalid letter")
+            query = query.filter(Artist.name >= letter.upper())
+        qrRes, prev_cursor, next_cursor = keyset_page(
+            query, (Artist.name, Artist.id), after, before, per_page)
+
+        return {
+            "artists": [{
+                "id": artist.id,
+                "name": artist.name
+            } for artist in qrRes],
+            "prev_cursor": prev_cursor,
+            "next_cursor": next_cursor
+        }
 
     @staticmethod
-    def search(search_term=""):
-        qrRes = Artist.query \
-            .filter(Artist.name.ilike("%" + search_term + "%")) \
-            .order_by(Artist.name).all()
+    def search(search_term="", genre_id=None):
+        qrRes = ranked_search(Artist, ArtistGenre.artist_id, "ArtistSearch",
+                              search_term, genre_id)
 
         res = {
             "count": len(qrRes),
             "data": [{
                 "id": artist.id,
                 "name": artist.name,
-                "num_upcoming_shows": len(
-                    [show for show in artist.shows
-                     if show.start_time >= datetime.now()])
+                "num_upcoming_shows": artist.num_upcoming_shows
             } for artist in qrRes]
         }
 
@@ -161,9 +427,16 @@ class Artist(db.Model):
 @dataclass
 class ArtistGenre(db.Model):
     __tablename__ = "ArtistGenre"
-    id: int = db.Column(db.Integer, primary_key=True)
-    artist_id: int = db.Column(db.Integer, db.ForeignKey("Artist.id"))
-    genre: int = db.Column(db.String(30), nullable=False)
+    artist_id: int = db.Column(db.Integer,
+                               db.ForeignKey("Artist.id", ondelete="CASCADE"),
+                               primary_key=True)
+    genre_id: int = db.Column(db.Integer, db.ForeignKey("Genre.id"),
+                              primary_key=True)
+
+    __table_args__ = (
+        db.Index("ix_ArtistGenre_genre_id_artist_id", "genre_id",
+                 "artist_id"),
+    )
 
 
 @dataclass
@@ -183,17 +456,33 @@ class Venue(db.Model):
     seeking_talent: bool = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description: str = db.Column(db.String(120), nullable=False,
                                          default="")
-    genres: List[str] = db.relationship("VenueGenre", backref="venue")
+    upcoming_show_count: int = db.Column(db.Integer, nullable=False,
+                                         default=0, server_default="0")
+    past_show_count: int = db.Column(db.Integer, nullable=False, default=0,
+                                     server_default="0")
+    version: int = db.Column(db.Integer, nullable=False, default=1,
+                             server_default="1")
+    genres: List[str] = db.relationship("Genre", secondary="VenueGenre",
+                                        order_by="Genre.name",
+                                        passive_deletes=True)
     artists: List[str] = db.relationship("Show", back_populates="venue")
 
+    __table_args__ = (
+        db.Index("ix_Venue_state_city_id", "state", "city", "id"),
+    )
+    __mapper_args__ = {"version_id_col": version}
+
     @property
     def details(self):
-        upcoming_shows = [show for show in self.shows
-                          if show.start_time >= datetime.now()]
-        past_shows = [show for show in self.shows
-                      if show.start_time < datetime.now()]
+        return self.select_details()
 
-        return {
+    def select_details(self, fields=None):
+        """Return the detail payload, restricted to `fields` if given.
+
+        Genres and shows are only queried when a field that needs them is
+        selected.
+        """
+        res = {
             "id": self.id,
             "name": self.name,
             "address": self.address,
@@ -205,23 +494,46 @@ class Venue(db.Model):
             "image_link": self.image_link,
             "seeking_talent": self.seeking_talent,
             "seeking_description": self.seeking_description,
-            "genres": [x.genre for x in self.genres],
-            "artists": self.artists,
-            "upcoming_shows_count": len(upcoming_shows),
-            "upcoming_shows": [{
-                "artist_id": show.artist_id,
-                "artist_name": show.artist.name,
-                "artist_image_link": show.venue.image_link,
-                "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S')}
-                for show in upcoming_shows],
-            "past_shows_count": len(past_shows),
-            "past_shows": [{
-                "artist_id": show.artist_id,
-                "artist_name": show.artist.name,
-                "artist_image_link": show.artist.image_link,
-                "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S')}
-                for show in past_shows]
+            "version": self.version
         }
+        if fields is None or "genres" in fields:
+            res["genres"] = [genre.name for genre in self.genres]
+        if fields is None or not SHOW_DETAIL_FIELDS.isdisjoint(fields):
+            now = request_now()
+            shows = db.session.query(
+                Show.artist_id, Artist.name.label("artist_name"),
+                Artist.image_link.label("artist_image_link"),
+                Show.start_time,
+                (Show.start_time >= now).label("upcoming")) \
+                .join(Artist, Artist.id == Show.artist_id) \
+                .filter(Show.venue_id == self.id)
+            # Without past shows, only the partitions of upcoming shows are
+            # read on Postgres.
+            if fields is not None and \
+                    PAST_SHOW_DETAIL_FIELDS.isdisjoint(fields):
+                shows = shows.filter(Show.start_time >= now)
+            shows = shows.order_by(Show.start_time, Show.id).all()
+            upcoming_shows = [show for show in shows if show.upcoming]
+            past_shows = [show for show in shows if not show.upcoming]
+            res.update({
+                "upcoming_shows_count": len(upcoming_shows),
+                "upcoming_shows": [{
+                    "artist_id": show.artist_id,
+                    "artist_name": show.artist_name,
+                    "artist_image_link": show.artist_image_link,
+                    "start_time": show.start_time}
+                    for show in upcoming_shows],
+                "past_shows_count": len(past_shows),
+                "past_shows": [{
+                    "artist_id": show.artist_id,
+                    "artist_name": show.artist_name,
+                    "artist_image_link": show.artist_image_link,
+                    "start_time": show.start_time}
+                    for show in past_shows]
+            })
+        if fields is not None:
+            res = {key: value for key, value in res.items() if key in fields}
+        return res
 
     @staticmethod
     def create(venueRequest):
@@ -231,11 +543,10 @@ class Venue(db.Model):
             state=venueRequest.state.data,
             address=venueRequest.address.data,
             phone=venueRequest.phone.data,
-            website=venueRequest.website.data,
-            facebook_link=venueRequest.facebook_link.data,
-            image_link=venueRequest.image_link.data,
-            genres=[VenueGenre(genre=genre)
-                    for genre in venueRequest.genres.data]
+            website=form_data(Venue, "website", venueRequest),
+            facebook_link=form_data(Venue, "facebook_link", venueRequest),
+            image_link=form_data(Venue, "image_link", venueRequest),
+            genres=Genre.named(venueRequest.genres.data)
         )
 
         try:
@@ -251,107 +562,168 @@ class Venue(db.Model):
         return venue
 
     @staticmethod
-    def find(id: int):
+    def calendar(id: int, start: datetime, end: datetime):
+        """The venue's shows in [`start`, `end`); see show_calendar().
+        Returns None if there is no such venue."""
+        if db.session.query(Venue.id).filter(Venue.id == id).first() is None:
+            return None
+        return show_calendar(start, end, Show.venue_id == id)
+
+    @staticmethod
+    def find(id: int, fields=None):
         venue = Venue.query.get(id)
         if venue is None:
             return None
         else:
-            return venue.details
+            return venue.select_details(fields)
 
     @staticmethod
-    def update(id: int, venueRequest):
-        venue = Venue.query.get(id)
-        venue.name = venueRequest.name.data,
-        venue.city = venueRequest.city.data,
-        venue.state = venueRequest.state.data,
-        venue.address = venueRequest.address.data,
-        venue.phone = venueRequest.phone.data,
-        venue.website = venueRequest.website.data,
-        venue.facebook_link = venueRequest.facebook_link.data,
-        venue.image_link = venueRequest.image_link.data,
-        venue.genres = [VenueGenre(genre=genre)
-                        for genre in venueRequest.genres.data]
+    def listing(fields=LISTING_FIELDS["Venue"], genre_id=None):
+        """Yield every venue as a dict of the selected columns, in id order,
+        holding one keyset page of rows in memory at a time. `genre_id`
+        restricts the listing to one genre through
+        ix_VenueGenre_genre_id_venue_id."""
+        columns = [getattr(Venue, field) for field in fields
+                   if field != "id"]
+        query = db.session.query(Venue.id, *columns)
+        if genre_id is not None:
+            query = query \
+                .join(VenueGenre, VenueGenre.venue_id == Venue.id) \
+                .filter(VenueGenre.genre_id == genre_id)
+        for row in iter_keyset(query, (Venue.id,)):
+            yield {field: getattr(row, field) for field in fields}
 
-        db.session.commit()
+    @staticmethod
+    def update(id: int, venueRequest):
+        """Save the edits in `venueRequest`; see update_changed()."""
+        return update_changed(Venue, VenueGenre.venue_id, id, venueRequest,
+                              EDITABLE_FIELDS["Venue"])
 
     @staticmethod
     def delete(id: int):
-        try:
-            venue = Venue.query.get(id)
-            db.session.delete(venue)
-            db.session.commit()
-        except (DBAPIError, SQLAlchemyError) as e:
-            db.session.rollback()
-            raise e
-        finally:
-            db.session.close()
+        """Delete the venue; see delete_cascading()."""
+        return delete_cascading(Venue, Show.venue_id, Artist, Show.artist_id,
+                                id)
 
     @staticmethod
     def byLocation():
-        qrRes = Venue.query.order_by(Venue.state, Venue.city).all()
-
-        res = []
-        for r in qrRes:
-            upcoming_shows = [show for show in r.shows
-                              if show.start_time >= datetime.now()]
-            venue = {
-                "id": r.id,
-                "name": r.name,
-                "num_upcoming_shows": len(upcoming_shows)
-            }
-            if len(res) > 0 and res[-1]["city"] == r.city and \
-               res[-1]["state"] == r.state:
-                res[-1]["venues"].append(venue)
-            else:
-                res.append({
-                    "city": r.city,
-                    "state": r.state,
-                    "venues": [venue]
-                })
+        """Return the venues grouped by (state, city), read from the
+        VenueArea summary with one row per area."""
+        return [{"city": area.city, "state": area.state,
+                 "venues": area.venues}
+                for area in VenueArea.query.order_by(VenueArea.state,
+                                                     VenueArea.city)]
 
-        return res
+    @staticmethod
+    def streamByLocation(batch_size=500):
+        """Lazy variant of byLocation for streamed rendering.
+
+        Areas come from a server-side cursor in batches of `batch_size`, so
+        they must be consumed in order, as a template loop does.
+        """
+        areas = db.session.query(
+            VenueArea.city, VenueArea.state, VenueArea.venues) \
+            .order_by(VenueArea.state, VenueArea.city) \
+            .yield_per(batch_size)
+        for area in areas:
+            yield {"city": area.city, "state": area.state,
+                   "venues": area.venues}
 
     @staticmethod
-    def search(search_term=""):
-        qrRes = Venue.query \
-            .filter(Venue.name.ilike("%" + search_term + "%")) \
-            .order_by(Venue.state, Venue.city).all()
+    def search(search_term="", genre_id=None):
+        qrRes = ranked_search(Venue, VenueGenre.venue_id, "VenueSearch",
+                              search_term, genre_id)
 
         res = {
             "count": len(qrRes),
             "data": [{
                 "id": venue.id,
                 "name": venue.name,
-                "num_upcoming_shows": len(
-                    [show for show in venue.shows
-                     if show.start_time >= datetime.now()])
+                "num_upcoming_shows": venue.num_upcoming_shows
             } for venue in qrRes]
         }
 
         return res
 
 
+@dataclass
+class VenueArea(db.Model):
+    """The venues of each (state, city) with their upcoming show counts,
+    as listed on /venues.
+
+    Rows are maintained by triggers on Venue (see VENUE_AREA_DDL): a
+    write that adds, removes or moves a venue, renames it or changes its
+    upcoming show counter rebuilds the rows of the areas it touched, in
+    the same transaction.
+    """
+    __tablename__ = "VenueArea"
+    state: str = db.Column(db.String(2), primary_key=True)
+    city: str = db.Column(db.String(120), primary_key=True)
+    venue_count: int = db.Column(db.Integer, nullable=False)
+    upcoming_show_count: int = db.Column(db.Integer, nullable=False)
+    # [{"id": ..., "name": ..., "num_upcoming_shows": ...}] in id order.
+    venues: List[dict] = db.Column(db.JSON, nullable=False)
+
+    @staticmethod
+    def calendar(state: str, city: str, start: datetime, end: datetime):
+        """The shows at the venues of a city in [`start`, `end`); see
+        show_calendar(). Returns None if the city has no venues."""
+        if VenueArea.query.get((state, city)) is None:
+            return None
+        return show_calendar(start, end, Venue.state == state,
+                             Venue.city == city, join_venue=True)
+
+
 @dataclass
 class VenueGenre(db.Model):
     __tablename__ = "VenueGenre"
-    id: int = db.Column(db.Integer, primary_key=True)
-    venue_id: int = db.Column(db.Integer, db.ForeignKey("Venue.id"))
-    genre: str = db.Column(db.String(30), nullable=False)
+    venue_id: int = db.Column(db.Integer,
+                              db.ForeignKey("Venue.id", ondelete="CASCADE"),
+                              primary_key=True)
+    genre_id: int = db.Column(db.Integer, db.ForeignKey("Genre.id"),
+                              primary_key=True)
+
+    __table_args__ = (
+        db.Index("ix_VenueGenre_genre_id_venue_id", "genre_id", "venue_id"),
+    )
 
 
 @dataclass
 class Show(db.Model):
+    """A show of an artist at a venue.
+
+    On Postgres the table is partitioned by month of start_time, with
+    (id, start_time) as its primary key; see partitions.py.
+    """
     __tablename__ = "Show"
     id: int = db.Column(db.Integer, primary_key=True)
     artist_id: int = db.Column(db.Integer, db.ForeignKey(
-        'Artist.id'), nullable=False)
+        'Artist.id', ondelete='CASCADE'), nullable=False)
     artist: Artist = db.relationship(
-        'Artist', backref=db.backref('shows', cascade='all, delete'))
+        'Artist', backref=db.backref('shows', cascade='all, delete',
+                                     passive_deletes=True))
     venue_id: int = db.Column(db.Integer, db.ForeignKey(
-        'Venue.id'), nullable=False)
+        'Venue.id', ondelete='CASCADE'), nullable=False)
     venue: Venue = db.relationship(
-        'Venue', backref=db.backref('shows', cascade='all, delete'))
+        'Venue', backref=db.backref('shows', cascade='all, delete',
+                                    passive_deletes=True))
     start_time: datetime = db.Column(db.DateTime(), nullable=False)
+    duration: int = db.Column(db.Integer, nullable=False,
+                              default=DEFAULT_SHOW_DURATION,
+                              server_default=str(DEFAULT_SHOW_DURATION))
+
+    __table_args__ = (
+        db.CheckConstraint(
+            "duration BETWEEN 1 AND {}".format(MAX_SHOW_DURATION),
+            name="ck_Show_duration"),
+        db.Index("ix_Show_start_time_id", "start_time", "id"),
+        db.Index("ix_Show_venue_id_start_time", "venue_id", "start_time"),
+        db.Index("ix_Show_artist_id_start_time", "artist_id", "start_time"),
+    )
+
+    @property
+    def end_time(self):
+        return self.start_time + timedelta(minutes=self.duration)
 
     @property
     def details(self):
@@ -360,15 +732,674 @@ class Show(db.Model):
             "artist_name": self.artist.name,
             "venue_id": self.venue_id,
             "venue_name": self.venue.name,
-            "start_time": self.start_time.strftime('%Y-%m-%d %H:%M:%S'),
+            "start_time": self.start_time,
+            "duration": self.duration,
             "artist_image_link": self.artist.image_link
         }
 
+    @staticmethod
+    def create(showRequest):
+        """Book the show in `showRequest`.
+
+        The venue and artist rows are locked first, so that concurrent
+        bookings of either are checked one after the other, and the show is
+        only inserted if neither is booked at an overlapping time; otherwise
+        BookingConflict is raised.
+        """
+        if showRequest.start_time.data is None:
+            raise ValueError("Show start time is missing or invalid")
+        duration = showRequest.duration.data or DEFAULT_SHOW_DURATION
+        if not 1 <= duration <= MAX_SHOW_DURATION:
+            raise ValueError("Show duration must be between 1 and {} "
+                             "minutes".format(MAX_SHOW_DURATION))
+        show = Show(
+            venue_id=int(showRequest.venue_id.data),
+            artist_id=int(showRequest.artist_id.data),
+            start_time=showRequest.start_time.data,
+            duration=duration
+        )
+
+        bookings = ((Venue, Show.venue_id, show.venue_id),
+                    (Artist, Show.artist_id, show.artist_id))
+        try:
+            # Always Venue before Artist, so lockers never wait on each other
+            # in a cycle.
+            for entity, _, id in bookings:
+                db.session.query(entity.id).filter(entity.id == id) \
+                    .with_for_update().first()
+            for entity, show_fk, id in bookings:
+                conflict = find_booking_conflict(
+                    show_fk, id, show.start_time, show.end_time)
+                if conflict is not None:
+                    raise BookingConflict(entity.__name__, id, conflict)
+            db.session.add(show)
+            db.session.commit()
+        except (BookingConflict, DBAPIError, SQLAlchemyError):
+            db.session.rollback()
+            raise
+
+        return show
+
+    @staticmethod
+    def rollover(since: datetime):
+        """Move shows that started between `since` and now from the upcoming
+        to the past counters of their venue and artist.
+
+        Meant to run periodically with `since` a little before the previous
+        run; the affected counters are recounted, so overlapping windows are
+        harmless.
+        """
+        now = request_now()
+        try:
+            for entity, show_fk in ((Venue, Show.venue_id),
+                                    (Artist, Show.artist_id)):
+                recount_shows(entity, show_fk, db.select([show_fk])
+                              .where(Show.start_time >= since)
+                              .where(Show.start_time < now))
+            db.session.commit()
+        except (DBAPIError, SQLAlchemyError) as e:
+            db.session.rollback()
+            raise e
+        finally:
+            db.session.close()
+
+    @staticmethod
+    def listing(fields=LISTING_FIELDS["Show"]):
+        """Yield every show as a dict of the selected fields, in
+        (start_time, id) order, holding one keyset page of rows in memory at
+        a time. Artist and venue are only joined when a field needs them."""
+        columns = {
+            "id": Show.id,
+            "start_time": Show.start_time,
+            "duration": Show.duration,
+            "venue_id": Show.venue_id,
+            "venue_name": Venue.name.label("venue_name"),
+            "artist_id": Show.artist_id,
+            "artist_name": Artist.name.label("artist_name"),
+            "artist_image_link": Artist.image_link.label("artist_image_link")
+        }
+        query = db.session.query(
+            Show.id, Show.start_time,
+            *[columns[field] for field in fields
+              if field not in ("id", "start_time")])
+        if not {"venue_name"}.isdisjoint(fields):
+            query = query.join(Venue, Venue.id == Show.venue_id)
+        if not {"artist_name", "artist_image_link"}.isdisjoint(fields):
+            query = query.join(Artist, Artist.id == Show.artist_id)
+        for row in iter_keyset(query, (Show.start_time, Show.id)):
+            yield {field: getattr(row, field) for field in fields}
+
+    @staticmethod
+    def stream(batch_size=500):
+        """Yield every show in (start_time, id) order for streamed
+        rendering, reading rows from a server-side cursor in batches of
+        `batch_size`."""
+        qrRes = db.session.query(
+            Show.start_time,
+            Show.artist_id, Artist.name.label("artist_name"),
+            Artist.image_link.label("artist_image_link"),
+            Show.venue_id, Venue.name.label("venue_name")) \
+            .join(Artist, Artist.id == Show.artist_id) \
+            .join(Venue, Venue.id == Show.venue_id) \
+            .order_by(Show.start_time, Show.id) \
+            .yield_per(batch_size)
+
+        for show in qrRes:
+            yield {
+                "artist_id": show.artist_id,
+                "artist_name": show.artist_name,
+                "venue_id": show.venue_id,
+                "venue_name": show.venue_name,
+                "start_time": show.start_time,
+                "artist_image_link": show.artist_image_link
+            }
+
+    @staticmethod
+    def page(after=None, before=None, per_page=30):
+        """Return one page of shows ordered by (start_time, id)."""
+        qrRes, prev_cursor, next_cursor = keyset_page(
+            db.session.query(
+                Show.id, Show.start_time,
+                Show.artist_id, Artist.name.label("artist_name"),
+                Artist.image_link.label("artist_image_link"),
+                Show.venue_id, Venue.name.label("venue_name"))
+            .join(Artist, Artist.id == Show.artist_id)
+            .join(Venue, Venue.id == Show.venue_id),
+            (Show.start_time, Show.id), after, before, per_page)
+
+        return {
+            "shows": [{
+                "artist_id": show.artist_id,
+                "artist_name": show.artist_name,
+                "venue_id": show.venue_id,
+                "venue_name": show.venue_name,
+                "start_time": show.start_time,
+                "artist_image_link": show.artist_image_link
+            } for show in qrRes],
+            "prev_cursor": prev_cursor,
+            "next_cursor": next_cursor
+        }
+
+
+# ----------------------------------------------------------------------------#
+# Bookings.
+# ----------------------------------------------------------------------------#
+
+
+class BookingConflict(Exception):
+    """A venue or artist is already booked when a new show would be."""
+
+    def __init__(self, entity, id, show):
+        super().__init__("{} {} is booked from {:%Y-%m-%d %H:%M} to "
+                         "{:%Y-%m-%d %H:%M}".format(
+                             entity, id, show.start_time, show.end_time))
+        self.entity = entity
+        self.id = id
+        self.show = show
+
+
+def find_booking_conflict(show_fk, id, start, end):
+    """Return a show of the venue or artist `show_fk` == `id` that overlaps
+    [`start`, `end`), or None.
+
+    An overlapping show starts before `end`, and since no show lasts more
+    than MAX_SHOW_DURATION, after `start` - MAX_SHOW_DURATION. Only shows
+    starting in that window are read, by a range scan of the
+    (venue_id, start_time) or (artist_id, start_time) index that on Postgres
+    also prunes the partitions of every other month, so the cost does not
+    grow with the length of the calendar.
+    """
+    candidates = db.session.query(Show) \
+        .filter(show_fk == id,
+                Show.start_time > start - timedelta(minutes=MAX_SHOW_DURATION),
+                Show.start_time < end) \
+        .order_by(Show.start_time)
+    for show in candidates:
+        if show.end_time > start:
+            return show
+    return None
+
+
+class BookingCalendar:
+    """The bookings of some venues or artists, for checking many new shows
+    against them and against each other, as the importer does.
+
+    `windows` are the (id, start, end) of the new shows. The shows that
+    could overlap them are read with the range scans of
+    find_booking_conflict(), one OR of ranges per query for up to
+    `chunk_size` windows, after merging the windows of each id that
+    overlap.
+    """
+
+    def __init__(self, show_fk, windows, chunk_size=500):
+        self.booked = {}
+        longest = timedelta(minutes=MAX_SHOW_DURATION)
+        ranges = []
+        for id, start, end in sorted(windows):
+            low = start - longest
+            if ranges and ranges[-1][0] == id and low < ranges[-1][2]:
+                ranges[-1][2] = max(ranges[-1][2], end)
+            else:
+                ranges.append([id, low, end])
+        for n in range(0, len(ranges), chunk_size):
+            for id, start_time, duration in db.session.query(
+                    show_fk, Show.start_time, Show.duration).filter(db.or_(*[
+                        db.and_(show_fk == key, Show.start_time > low,
+                                Show.start_time < high)
+                        for key, low, high in ranges[n:n + chunk_size]])):
+                self.booked.setdefault(id, []).append(
+                    (start_time,
+                     start_time + timedelta(minutes=duration)))
+        for intervals in self.booked.values():
+            intervals.sort()
+
+    def conflicts(self, id, start, end):
+        """Whether `id` is booked at a time that overlaps [`start`, `end`)."""
+        intervals = self.booked.get(id, [])
+        n = bisect.bisect_right(
+            intervals, (start - timedelta(minutes=MAX_SHOW_DURATION),
+                        datetime.max))
+        while n < len(intervals) and intervals[n][0] < end:
+            if intervals[n][1] > start:
+                return True
+            n += 1
+        return False
+
+    def book(self, id, start, end):
+        bisect.insort(self.booked.setdefault(id, []), (start, end))
+
+
+# ----------------------------------------------------------------------------#
+# Calendars.
+# ----------------------------------------------------------------------------#
+
+
+def time_bucket(unit, column):
+    """Truncate the timestamps of `column` to the date their day or their
+    week, starting on Monday, begins on: date_trunc on Postgres, date()
+    with modifiers elsewhere. `unit` is "day" or "week"."""
+    if unit not in ("day", "week"):
+        raise ValueError("Unknown time bucket: " + unit)
+    if db.session.get_bind().dialect.name == "postgresql":
+        # A literal rather than a bound unit, so that GROUP BY and the
+        # select list hold the same expression.
+        return db.cast(db.func.date_trunc(
+            db.literal_column("'{}'".format(unit)), column), db.Date)
+    modifiers = [] if unit == "day" else [
+        db.literal_column("'weekday 0'"), db.literal_column("'-6 days'")]
+    return db.func.date(column, *modifiers, type_=db.Date)
+
+
+def show_calendar(start, end, *criteria, join_venue=False):
+    """Return the shows matching `criteria` that start in [`start`, `end`),
+    with their number per day and per week.
+
+    The counts are aggregated in SQL, joining Venue only if `join_venue`
+    is set because the criteria refer to it. Every query is bounded by
+    start_time, so with an equality on venue_id or artist_id, or on the
+    state and city of the venues, it is a range scan of
+    (venue_id, start_time) or (artist_id, start_time) that reads only the
+    shows of the window, however many others there are.
+    """
+    window = (Show.start_time >= start, Show.start_time < end) + criteria
+
+    shows = db.session.query(
+        Show.id, Show.start_time, Show.duration,
+        Show.venue_id, Venue.name.label("venue_name"),
+        Show.artist_id, Artist.name.label("artist_name"),
+        Artist.image_link.label("artist_image_link")) \
+        .join(Venue, Venue.id == Show.venue_id) \
+        .join(Artist, Artist.id == Show.artist_id) \
+        .filter(*window) \
+        .order_by(Show.start_time, Show.id)
+
+    def counts(unit):
+        bucket = time_bucket(unit, Show.start_time).label("start")
+        query = db.session.query(bucket, db.func.count().label("shows")) \
+            .select_from(Show)
+        if join_venue:
+            query = query.join(Venue, Venue.id == Show.venue_id)
+        return [{"start": row.start, "shows": row.shows}
+                for row in query.filter(*window)
+                .group_by(bucket).order_by(bucket)]
+
+    return {
+        "from": start,
+        "to": end,
+        "shows": [{
+            "id": show.id,
+            "start_time": show.start_time,
+            "duration": show.duration,
+            "venue_id": show.venue_id,
+            "venue_name": show.venue_name,
+            "artist_id": show.artist_id,
+            "artist_name": show.artist_name,
+            "artist_image_link": show.artist_image_link
+        } for show in shows],
+        "days": counts("day"),
+        "weeks": counts("week")
+    }
+
+
+# ----------------------------------------------------------------------------#
+# Edits.
+# ----------------------------------------------------------------------------#
+
+
+def form_data(entity, field, form):
+    """Return the `field` input of `form`, or the `field` of a row, with an
+    empty string read as NULL for nullable columns, as the importer stores
+    them."""
+    value = getattr(form, field)
+    value = getattr(value, "data", value)
+    if value == "" and getattr(entity, field).nullable:
+        return None
+    return value
+
+
+def update_changed(entity, genre_fk, id, form, fields):
+    """Apply an edit form to the `entity` row `id`.
+
+    The stored row is compared with the form. Only the columns in `fields`
+    that differ are written, in one UPDATE that also increments the row
+    version. Genre links are only inserted or deleted for genres that were
+    added or removed. The UPDATE is conditional on the version the form was
+    rendered from, and StaleDataError is raised if the row has changed
+    since; ValueError is raised if the form does not say which version
+    that was. Returns False if there is no such row.
+    """
+    stored = db.session.query(
+        entity.version, *[getattr(entity, field) for field in fields]) \
+        .filter(entity.id == id).first()
+    if stored is None:
+        return False
+    version = form.version.data
+    if version is None:
+        raise ValueError("The edit form has no valid row version")
+    stale = "{} {} has been changed since version {}".format(
+        entity.__name__, id, version)
+    if version != stored.version:
+        raise StaleDataError(stale)
+    links = genre_fk.class_
+
+    try:
+        changes = {field: form_data(entity, field, form) for field in fields
+                   if form_data(entity, field, form) !=
+                   form_data(entity, field, stored)}
+        linked = {genre_id for genre_id, in
+                  db.session.query(links.genre_id).filter(genre_fk == id)}
+        wanted = set(Genre.ids(form.genres.data).values())
+        if not changes and linked == wanted:
+            db.session.commit()
+            return True
+
+        changes["version"] = entity.version + 1
+        updated = db.session.query(entity) \
+            .filter(entity.id == id, entity.version == version) \
+            .update(changes, synchronize_session=False)
+        if updated != 1:
+            raise StaleDataError(stale)
+        db.session.add_all(links(**{genre_fk.key: id, "genre_id": genre_id})
+                           for genre_id in wanted - linked)
+        if linked - wanted:
+            db.session.query(links) \
+                .filter(genre_fk == id,
+                        links.genre_id.in_(linked - wanted)) \
+                .delete(synchronize_session=False)
+        db.session.commit()
+    except (DBAPIError, SQLAlchemyError):
+        db.session.rollback()
+        raise
+    return True
+
+
+def delete_cascading(entity, show_fk, other, other_fk, id):
+    """Delete the `entity` row `id` with set-based statements.
+
+    Its shows and genre links are removed by the database through their
+    ON DELETE CASCADE foreign keys, so no child row is loaded. The show
+    counters of the `other` rows it shared shows with are then recounted
+    in one UPDATE. Returns False if there is no such row.
+    """
+    try:
+        ids = [other_id for other_id, in
+               db.session.query(other_fk).filter(show_fk == id).distinct()]
+        deleted = db.session.query(entity).filter(entity.id == id) \
+            .delete(synchronize_session=False)
+        if ids:
+            recount_shows(other, other_fk, ids)
+        db.session.commit()
+    except (DBAPIError, SQLAlchemyError):
+        db.session.rollback()
+        raise
+    finally:
+        db.session.close()
+    return deleted == 1
+
+
+# ----------------------------------------------------------------------------#
+# Show counters.
+# ----------------------------------------------------------------------------#
+
+
+def changed_tables(session):
+    """The names of the tables `session` wrote in its transaction, which
+    the page cache invalidates on commit. Statements run with
+    session.execute() bypass the unit of work and must add their table."""
+    return session.info.setdefault("changed_tables", set())
+
+
+def recount_shows(entity, show_fk, ids=None):
+    """Recompute the show counters of `entity` rows from the Show table in a
+    single UPDATE, for all rows or only those whose id is in `ids`."""
+    now = request_now()
+    counts = db.select([db.func.count(Show.id)]).where(show_fk == entity.id)
+    statement = entity.__table__.update().values(
+        upcoming_show_count=counts.where(Show.start_time >= now).as_scalar(),
+        past_show_count=counts.where(Show.start_time < now).as_scalar())
+    if ids is not None:
+        statement = statement.where(entity.id.in_(ids))
+    db.session.execute(statement)
+    changed_tables(db.session).add(entity.__tablename__)
+
+
+@db.event.listens_for(db.session, "after_flush")
+def count_shows(session, flush_context):
+    """Apply inserted and deleted shows to the counters of their venue and
+    artist, in the same transaction as the flush."""
+    now = request_now()
+    deltas = {}
+    for shows, sign in ((session.new, 1), (session.deleted, -1)):
+        for show in shows:
+            if not isinstance(show, Show):
+                continue
+            index = 0 if show.start_time >= now else 1
+            for key in ((Venue, show.venue_id), (Artist, show.artist_id)):
+                deltas.setdefault(key, [0, 0])[index] += sign
+
+    for (entity, id), (upcoming, past) in deltas.items():
+        if upcoming or past:
+            session.execute(
+                entity.__table__.update()
+                .where(entity.id == id)
+                .values(upcoming_show_count=entity.upcoming_show_count
+                        + upcoming,
+                        past_show_count=entity.past_show_count + past))
+            changed_tables(session).add(entity.__tablename__)
+
+
+# ----------------------------------------------------------------------------#
+# Venue areas.
+# ----------------------------------------------------------------------------#
+
+# Rebuilds the VenueArea row of the area of the `{row}` venue on SQLite.
+SQLITE_VENUE_AREA_REFRESH = """
+    DELETE FROM "VenueArea" WHERE state = {row}.state AND city = {row}.city;
+    INSERT INTO "VenueArea"
+      (state, city, venue_count, upcoming_show_count, venues)
+    SELECT state, city, count(*), sum(upcoming_show_count),
+           json_group_array(json_object(
+             'id', id, 'name', name,
+             'num_upcoming_shows', upcoming_show_count))
+    FROM (SELECT * FROM "Venue"
+          WHERE state = {row}.state AND city = {row}.city ORDER BY id)
+    GROUP BY state, city;"""
+
+# Postgres rebuilds each area touched by a statement once, from the
+# statement's transition tables, under a transaction-level advisory lock on
+# the area so that concurrent writers to one area rebuild it in turn. SQLite
+# has no statement-level triggers and rebuilds the area of each changed row.
+VENUE_AREA_DDL = {
+    "postgresql": [
+        """CREATE FUNCTION "VenueArea_refresh_area"(
+             area_state varchar, area_city varchar) RETURNS void
+           LANGUAGE plpgsql AS $$
+           BEGIN
+             PERFORM pg_advisory_xact_lock(hashtext('VenueArea'),
+                                           hashtext(area_state || '/'
+                                                    || area_city));
+             DELETE FROM "VenueArea"
+             WHERE state = area_state AND city = area_city;
+             INSERT INTO "VenueArea"
+               (state, city, venue_count, upcoming_show_count, venues)
+             SELECT state, city, count(*), sum(upcoming_show_count),
+                    json_agg(json_build_object(
+                      'id', id, 'name', name,
+                      'num_upcoming_shows', upcoming_show_count) ORDER BY id)
+             FROM "Venue" WHERE state = area_state AND city = area_city
+             GROUP BY state, city;
+           END $$""",
+        """CREATE FUNCTION "VenueArea_refresh"() RETURNS trigger
+           LANGUAGE plpgsql AS $$
+           BEGIN
+             IF TG_OP = 'INSERT' THEN
+               PERFORM "VenueArea_refresh_area"(state, city) FROM (
+                 SELECT DISTINCT state, city FROM new_rows
+                 ORDER BY state, city) areas;
+             ELSIF TG_OP = 'DELETE' THEN
+               PERFORM "VenueArea_refresh_area"(state, city) FROM (
+                 SELECT DISTINCT state, city FROM old_rows
+                 ORDER BY state, city) areas;
+             ELSE
+               PERFORM "VenueArea_refresh_area"(state, city) FROM (
+                 SELECT DISTINCT area.state, area.city
+                 FROM old_rows o JOIN new_rows n USING (id),
+                      LATERAL (VALUES (o.state, o.city), (n.state, n.city))
+                        AS area (state, city)
+                 WHERE (o.name, o.state, o.city, o.upcoming_show_count)
+                   IS DISTINCT FROM
+                   (n.name, n.state, n.city, n.upcoming_show_count)
+                 ORDER BY area.state, area.city) areas;
+             END IF;
+             RETURN NULL;
+           END $$""",
+        """CREATE TRIGGER "VenueArea_ai" AFTER INSERT ON "Venue"
+           REFERENCING NEW TABLE AS new_rows
+           FOR EACH STATEMENT EXECUTE PROCEDURE "VenueArea_refresh"()""",
+        """CREATE TRIGGER "VenueArea_au" AFTER UPDATE ON "Venue"
+           REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+           FOR EACH STATEMENT EXECUTE PROCEDURE "VenueArea_refresh"()""",
+        """CREATE TRIGGER "VenueArea_ad" AFTER DELETE ON "Venue"
+           REFERENCING OLD TABLE AS old_rows
+           FOR EACH STATEMENT EXECUTE PROCEDURE "VenueArea_refresh"()""",
+    ],
+    "sqlite": [
+        """CREATE TRIGGER "VenueArea_ai" AFTER INSERT ON "Venue" BEGIN"""
+        + SQLITE_VENUE_AREA_REFRESH.format(row="new") + """
+           END""",
+        """CREATE TRIGGER "VenueArea_au" AFTER UPDATE ON "Venue"
+           WHEN old.name IS NOT new.name OR old.state IS NOT new.state
+             OR old.city IS NOT new.city
+             OR old.upcoming_show_count IS NOT new.upcoming_show_count
+           BEGIN"""
+        + SQLITE_VENUE_AREA_REFRESH.format(row="old")
+        + SQLITE_VENUE_AREA_REFRESH.format(row="new") + """
+           END""",
+        """CREATE TRIGGER "VenueArea_ad" AFTER DELETE ON "Venue" BEGIN"""
+        + SQLITE_VENUE_AREA_REFRESH.format(row="old") + """
+           END""",
+    ],
+}
+
+for dialect, statements in VENUE_AREA_DDL.items():
+    for statement in statements:
+        db.event.listen(db.metadata, "after_create",
+                        db.DDL(statement).execute_if(dialect=dialect))
+
+
+# ----------------------------------------------------------------------------#
+# Search.
+# ----------------------------------------------------------------------------#
+
+# SQLite has no pg_trgm, so local databases keep an FTS5 trigram index per
+# searchable entity instead. Triggers keep it in sync with the entity and its
+# genres; the rowid of each index row is the id of the entity it describes.
+SQLITE_SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE "{entity}Search"
+       USING fts5(name, city, genres, tokenize='trigram')""",
+    """CREATE TRIGGER "{entity}Search_ai" AFTER INSERT ON "{entity}" BEGIN
+         INSERT INTO "{entity}Search" (rowid, name, city, genres)
+         VALUES (new.id, new.name, new.city, '');
+       END""",
+    """CREATE TRIGGER "{entity}Search_au" AFTER UPDATE ON "{entity}" BEGIN
+         UPDATE "{entity}Search" SET name = new.name, city = new.city
+         WHERE rowid = new.id;
+       END""",
+    """CREATE TRIGGER "{entity}Search_ad" AFTER DELETE ON "{entity}" BEGIN
+         DELETE FROM "{entity}Search" WHERE rowid = old.id;
+       END""",
+    """CREATE TRIGGER "{entity}GenreSearch_ai" AFTER INSERT ON "{entity}Genre"
+       BEGIN
+         UPDATE "{entity}Search" SET genres = (
+           SELECT group_concat(g.name, ' ') FROM "{entity}Genre" eg
+           JOIN "Genre" g ON g.id = eg.genre_id
+           WHERE eg.{fk} = new.{fk})
+         WHERE rowid = new.{fk};
+       END""",
+    """CREATE TRIGGER "{entity}GenreSearch_au" AFTER UPDATE ON "{entity}Genre"
+       BEGIN
+         UPDATE "{entity}Search" SET genres = (
+           SELECT group_concat(g.name, ' ') FROM "{entity}Genre" eg
+           JOIN "Genre" g ON g.id = eg.genre_id
+           WHERE eg.{fk} = "{entity}Search".rowid)
+         WHERE rowid IN (old.{fk}, new.{fk});
+       END""",
+    """CREATE TRIGGER "{entity}GenreSearch_ad" AFTER DELETE ON "{entity}Genre"
+       BEGIN
+         UPDATE "{entity}Search" SET genres = (
+           SELECT group_concat(g.name, ' ') FROM "{entity}Genre" eg
+           JOIN "Genre" g ON g.id = eg.genre_id
+           WHERE eg.{fk} = old.{fk})
+         WHERE rowid = old.{fk};
+       END""",
+]
+
+for entity, fk in (("Venue", "venue_id"), ("Artist", "artist_id")):
+    for statement in SQLITE_SEARCH_DDL:
+        db.event.listen(
+            db.metadata, "after_create",
+            db.DDL(statement.format(entity=entity, fk=fk))
+            .execute_if(dialect="sqlite"))
+
+
+def ranked_search(entity, genre_fk, fts_table, search_term, genre_id=None):
+    """Search `entity` by name, city and genre, best matches first.
+
+    On Postgres the ILIKE filters are served by the pg_trgm GIN indexes and
+    rows are ranked by trigram similarity; on SQLite the FTS5 table
+    `fts_table` is matched and ranked by bm25. Terms shorter than a trigram
+    fall back to plain, unranked ILIKE filters. `genre_fk` is the entity
+    column of its genre association, and `genre_id` restricts the results
+    to one genre.
+    """
+    search_term = (search_term or "").strip()
+    dialect = db.session.get_bind().dialect.name
+    links = genre_fk.class_
+    query = db.session.query(
+        entity.id, entity.name,
+        entity.upcoming_show_count.label("num_upcoming_shows"))
+    if genre_id is not None:
+        query = query.filter(entity.id.in_(
+            db.select([genre_fk]).where(links.genre_id == genre_id)))
+
+    if dialect == "sqlite" and len(search_term) >= 3:
+        hits = db.session.query(
+            db.literal_column("rowid").label("id"),
+            db.literal_column("rank").label("rank")) \
+            .select_from(db.table(fts_table)) \
+            .filter(db.text('"%s" MATCH :fts_query' % fts_table)
+                    .bindparams(fts_query='"%s"' %
+                                search_term.replace('"', '""'))) \
+            .subquery()
+        return query.join(hits, hits.c.id == entity.id) \
+            .order_by(hits.c.rank, entity.name).all()
+
+    pattern = "%" + search_term.replace("\\", "\\\\") \
+        .replace("%", "\\%").replace("_", "\\_") + "%"
+    # A union of the three lookups lets each one use its own index, where
+    # an OR across them would force a scan of the whole entity table.
+    query = query.filter(entity.id.in_(db.union(
+        db.select([entity.id])
+        .where(entity.name.ilike(pattern, escape="\\")),
+        db.select([entity.id])
+        .where(entity.city.ilike(pattern, escape="\\")),
+        db.select([genre_fk])
+        .where(links.genre_id.in_(
+            db.select([Genre.id])
+            .where(Genre.name.ilike(pattern, escape="\\")))))))
+
+    if dialect == "postgresql" and len(search_term) >= 3:
+        return query.order_by(
+            db.func.greatest(db.func.similarity(entity.name, search_term),
+                             db.func.similarity(entity.city, search_term))
+            .desc(), entity.name).all()
+    return query.order_by(entity.name).all()
+
 
 def init_load():
     artist1 = Artist(
         name="Guns N Petals",
-        genres=[ArtistGenre(genre="Rock n Roll")],
+        genres=Genre.named(["Rock n Roll"]),
         city="San Francisco",
         state="CA",
         phone="326-123-5000",
@@ -381,7 +1412,7 @@ def init_load():
 
     artist2 = Artist(
         name="Matt Quevedo",
-        genres=[ArtistGenre(genre="Jazz")],
+        genres=Genre.named(["Jazz"]),
         city="New York",
         state="NY",
         phone="300-400-5000",
@@ -392,7 +1423,7 @@ def init_load():
 
     artist3 = Artist(
         name="The Wild Sax Band",
-        genres=[ArtistGenre(genre="Jazz"), ArtistGenre(genre="Classical")],
+        genres=Genre.named(["Jazz", "Classical"]),
         city="San Francisco",
         state="CA",
         phone="432-325-5432",
@@ -405,8 +1436,7 @@ def init_load():
 
     venue1 = Venue(
         name="The Musical Hop",
-        genres=[VenueGenre(genre="Jazz"), VenueGenre(genre="Reggae"), VenueGenre(
-            genre="Swing"), VenueGenre(genre="Classical"), VenueGenre(genre="Folk")],
+        genres=Genre.named(["Jazz", "Reggae", "Swing", "Classical", "Folk"]),
         address="1015 Folsom Street",
         city="San Francisco",
         state="CA",
@@ -420,8 +1450,7 @@ def init_load():
 
     venue2 = Venue(
         name="The Dueling Pianos Bar",
-        genres=[VenueGenre(genre="Classical"), VenueGenre(
-            genre="R&B"), VenueGenre(genre="Hip-Hop")],
+        genres=Genre.named(["Classical", "R&B", "Hip-Hop"]),
         address="335 Delancey Street",
         city="New York",
         state="NY",
@@ -434,8 +1463,7 @@ def init_load():
 
     venue3 = Venue(
         name="Park Square Live Music & Coffee",
-        genres=[VenueGenre(genre="Rock n Roll"), VenueGenre(
-            genre="Jazz"), VenueGenre(genre="Classical"), VenueGenre(genre="Folk")],
+        genres=Genre.named(["Rock n Roll", "Jazz", "Classical", "Folk"]),
         address="34 Whiskey Moore Ave",
         city="San Francisco",
         state="CA",
@@ -450,15 +1478,15 @@ def init_load():
     db.session.commit()
 
     show1 = Show(artist=artist1, venue=venue1,
-                 start_time="2019-05-21T21:30:00.000Z")
+                 start_time=datetime(2019, 5, 21, 21, 30))
     show2 = Show(artist=artist2, venue=venue3,
-                 start_time="2019-06-15T23:00:00.000Z")
+                 start_time=datetime(2019, 6, 15, 23, 0))
     show3 = Show(artist=artist3, venue=venue3,
-                 start_time="2035-04-01T20:00:00.000Z")
+                 start_time=datetime(2035, 4, 1, 20, 0))
     show4 = Show(artist=artist3, venue=venue3,
-                 start_time="2035-04-08T20:00:00.000Z")
+                 start_time=datetime(2035, 4, 8, 20, 0))
     show5 = Show(artist=artist3, venue=venue3,
-                 start_time="2035-04-15T20:00:00.000Z")
+                 start_time=datetime(2035, 4, 15, 20, 0))
 
     db.session.add_all([show1, show2, show3, show4, show5])
     db.session.commit()
@@ -466,6 +1494,10 @@ def init_load():
 
 # set-up tables and load initial data
 if __name__ == "__main__":
-    # db.drop_all()
-    # db.create_all()
-    init_load()
+    # Run against the `models` module the app binds to, not `__main__`.
+    import models
+    from app import create_app
+    with create_app().app_context():
+        # models.db.drop_all()
+        # models.db.create_all()
+        models.init_load()
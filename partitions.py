@@ -0,0 +1,119 @@
+import re
+from datetime import datetime
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+from models import db, recount_shows, Artist, Show, Venue
+
+# ----------------------------------------------------------------------------#
+# Show partitions.
+# ----------------------------------------------------------------------------#
+
+# On Postgres, Show is partitioned by range of start_time (see migration
+# 5c0d8e2f7b14): "Show_pYYYYMM" holds the shows starting in that month, and
+# "Show_default" any show in a month without a partition of its own. Queries
+# bounded by start_time, as the upcoming shows of a venue or an artist are,
+# only read the partitions of the months they cover.
+
+_PARTITION_NAME = re.compile(r"^Show_p(\d{4})(\d{2})$")
+
+
+def month_start(value):
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month):
+    return "Show_p{:%Y%m}".format(month)
+
+
+def show_partitions():
+    """Map the first day of each month that has an attached partition to
+    the partition's name."""
+    if db.session.get_bind().dialect.name != "postgresql":
+        raise RuntimeError("Show is only partitioned on Postgres")
+    partitions = {}
+    for name, in db.session.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = '\"Show\"'::regclass"):
+        match = _PARTITION_NAME.match(name)
+        if match:
+            partitions[datetime(int(match.group(1)),
+                                int(match.group(2)), 1)] = name
+    return partitions
+
+
+def create_show_partitions(ahead=12, now=None):
+    """Create the partitions of the current month and of the `ahead`
+    following ones that do not exist yet. Shows of those months that were
+    filed in the default partition are moved into them. Returns the names
+    of the new partitions."""
+    first = month_start(now or datetime.now())
+    existing = show_partitions()
+    created = []
+    try:
+        for n in range(ahead + 1):
+            month = add_months(first, n)
+            if month in existing:
+                continue
+            name, bounds = partition_name(month), {
+                "lower": month, "upper": add_months(month, 1)}
+            db.session.execute(
+                'CREATE TABLE "{}" (LIKE "Show" INCLUDING DEFAULTS '
+                'INCLUDING CONSTRAINTS)'
+                .format(name))
+            db.session.execute(
+                'WITH moved AS (DELETE FROM "Show_default" '
+                'WHERE start_time >= :lower AND start_time < :upper '
+                'RETURNING *) INSERT INTO "{}" SELECT * FROM moved'
+                .format(name), bounds)
+            # Indexes and foreign keys of "Show" are added on attach.
+            db.session.execute(
+                'ALTER TABLE "Show" ATTACH PARTITION "{}" '
+                "FOR VALUES FROM ('{:%Y-%m-%d}') TO ('{:%Y-%m-%d}')"
+                .format(name, bounds["lower"], bounds["upper"]))
+            created.append(name)
+        db.session.commit()
+    except (DBAPIError, SQLAlchemyError):
+        db.session.rollback()
+        raise
+    return created
+
+
+def archive_show_partitions(months, now=None):
+    """Detach the partitions of the shows that started more than `months`
+    whole months ago and rename them "ShowArchive_pYYYYMM".
+
+    The archived tables keep their rows but leave "Show", so their shows
+    no longer appear anywhere in the app; the show counters of the venues
+    and artists they involved are recounted to match. Returns the names of
+    the archived partitions.
+    """
+    cutoff = add_months(month_start(now or datetime.now()), -months)
+    archived = []
+    try:
+        for month, name in sorted(show_partitions().items()):
+            if add_months(month, 1) > cutoff:
+                continue
+            ids = {
+                fk: [id for id, in db.session.execute(
+                    'SELECT DISTINCT {} FROM "{}"'.format(fk, name))]
+                for fk in ("venue_id", "artist_id")}
+            db.session.execute(
+                'ALTER TABLE "Show" DETACH PARTITION "{}"'.format(name))
+            archive = name.replace("Show_", "ShowArchive_", 1)
+            db.session.execute(
+                'ALTER TABLE "{}" RENAME TO "{}"'.format(name, archive))
+            if ids["venue_id"]:
+                recount_shows(Venue, Show.venue_id, ids["venue_id"])
+            if ids["artist_id"]:
+                recount_shows(Artist, Show.artist_id, ids["artist_id"])
+            archived.append(archive)
+        db.session.commit()
+    except (DBAPIError, SQLAlchemyError):
+        db.session.rollback()
+        raise
+    return archived
@@ -0,0 +1,182 @@
+import json
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import islice
+from types import SimpleNamespace
+from models import EDITABLE_FIELDS, db, find_booking_conflict, \
+    recount_shows, Artist, BookingCalendar, Genre, Show, Venue, VenueArea
+
+# ----------------------------------------------------------------------------#
+# Query plan regression check.
+# ----------------------------------------------------------------------------#
+
+
+def edit_form(entity, id):
+    """An edit form that renames row `id` of `entity` and keeps the rest,
+    as update_changed() receives it."""
+    row = entity.query.get(id)
+    values = {field: getattr(row, field)
+              for field in EDITABLE_FIELDS[entity.__name__]}
+    values.update(name=row.name + " (plan check)", version=row.version,
+                  genres=[genre.name for genre in row.genres])
+    return SimpleNamespace(**{field: SimpleNamespace(data=value)
+                              for field, value in values.items()})
+
+
+def first_pages(rows, pages=2, batch_size=500):
+    """Consume the first `pages` keyset or cursor pages of a listing."""
+    return list(islice(rows, (pages - 1) * batch_size + 1))
+
+
+# Every entry point of the models that queries the database, as (label,
+# call, relations that its queries are allowed to scan in full). Listing
+# all venues by area reads the whole VenueArea summary by design;
+# everything else must be served by indexes. The probes that write come
+# last, since they edit and delete the rows the others read; their changes
+# are rolled back.
+PROBES = [
+    ("Venue.byLocation", lambda ids: Venue.byLocation(), {"VenueArea"}),
+    ("Venue.streamByLocation",
+     lambda ids: first_pages(Venue.streamByLocation()), {"VenueArea"}),
+    ("Venue.listing", lambda ids: first_pages(Venue.listing()), set()),
+    ("Venue.search", lambda ids: Venue.search("music"), set()),
+    ("Venue.search genre",
+     lambda ids: Venue.search("music", ids["genre"]), set()),
+    ("Venue.listing genre",
+     lambda ids: list(Venue.listing(genre_id=ids["genre"])), set()),
+    ("Venue.find", lambda ids: Venue.find(ids["venue"]), set()),
+    ("Artist.search", lambda ids: Artist.search("band"), set()),
+    ("Artist.search genre",
+     lambda ids: Artist.search("band", ids["genre"]), set()),
+    ("Artist.listing genre",
+     lambda ids: list(Artist.listing(genre_id=ids["genre"])), set()),
+    ("Artist.listing", lambda ids: first_pages(Artist.listing()), set()),
+    ("Artist.find", lambda ids: Artist.find(ids["artist"]), set()),
+    ("Artist.page", lambda ids: Artist.page(), set()),
+    ("Artist.page letter", lambda ids: Artist.page(letter="M"), set()),
+    ("Artist.page after",
+     lambda ids: Artist.page(after=Artist.page()["next_cursor"]), set()),
+    ("Genre.listing", lambda ids: Genre.listing(), set()),
+    ("Show.listing", lambda ids: first_pages(Show.listing()), set()),
+    ("Show.stream", lambda ids: first_pages(Show.stream()), set()),
+    ("Show.page", lambda ids: Show.page(), set()),
+    ("Show.page after",
+     lambda ids: Show.page(after=Show.page()["next_cursor"]), set()),
+    ("Venue.calendar",
+     lambda ids: Venue.calendar(ids["venue"], datetime.now(),
+                                datetime.now() + timedelta(days=31)), set()),
+    ("Artist.calendar",
+     lambda ids: Artist.calendar(ids["artist"], datetime.now(),
+                                 datetime.now() + timedelta(days=31)), set()),
+    ("VenueArea.calendar",
+     lambda ids: VenueArea.calendar(*ids["area"], datetime.now(),
+                                    datetime.now() + timedelta(days=31)),
+     set()),
+    ("find_booking_conflict venue",
+     lambda ids: find_booking_conflict(
+         Show.venue_id, ids["venue"], datetime.now(),
+         datetime.now() + timedelta(hours=2)), set()),
+    ("find_booking_conflict artist",
+     lambda ids: find_booking_conflict(
+         Show.artist_id, ids["artist"], datetime.now(),
+         datetime.now() + timedelta(hours=2)), set()),
+    ("BookingCalendar",
+     lambda ids: BookingCalendar(Show.venue_id, [
+         (ids["venue"], datetime.now(), datetime.now() + timedelta(hours=2)),
+         (ids["venue"] + 1, datetime.now(),
+          datetime.now() + timedelta(hours=2))]), set()),
+    ("Venue.update",
+     lambda ids: Venue.update(ids["venue"], edit_form(Venue, ids["venue"])),
+     set()),
+    ("Artist.update",
+     lambda ids: Artist.update(ids["artist"],
+                               edit_form(Artist, ids["artist"])), set()),
+    ("recount_shows",
+     lambda ids: recount_shows(Venue, Show.venue_id, [ids["venue"]]),
+     set()),
+    ("Show.rollover",
+     lambda ids: Show.rollover(datetime.now() - timedelta(hours=25)), set()),
+    ("Venue.delete", lambda ids: Venue.delete(ids["venue"]), set()),
+    ("Artist.delete", lambda ids: Artist.delete(ids["artist"]), set()),
+]
+
+
+@contextmanager
+def captured_statements():
+    """Collect every (statement, parameters) sent to the database."""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(
+            (statement, parameters[0] if executemany else parameters))
+
+    db.event.listen(db.engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        db.event.remove(db.engine, "before_cursor_execute", capture)
+
+
+def seq_scans(plan):
+    """Yield the relation of every sequential scan node in a JSON plan."""
+    if plan.get("Node Type") == "Seq Scan":
+        yield plan["Relation Name"]
+    for child in plan.get("Plans", []):
+        yield from seq_scans(child)
+
+
+def check_plans(min_rows=10000):
+    """Run PROBES, EXPLAIN every statement they issue and return the
+    sequential scans of tables with at least `min_rows` rows that the probe
+    does not allow, as (label, relation, statement) tuples.
+
+    The probes run in one transaction that is rolled back at the end; the
+    commits of the models only end subtransactions of it. Small tables are
+    always scanned in full by the planner, so the check is only meaningful
+    on a database seeded at a realistic scale.
+    """
+    if db.engine.dialect.name != "postgresql":
+        raise RuntimeError("Query plans can only be checked on Postgres")
+
+    connection = db.engine.connect()
+    transaction = connection.begin()
+    failures = []
+    try:
+        # An empty `binds` keeps the models' tables from being bound to the
+        # engine rather than to this connection.
+        db.session.registry.set(
+            db.create_session({"bind": connection, "binds": {}})())
+
+        # The plans and the row counts below come from the planner
+        # statistics, which a freshly seeded database does not have yet.
+        db.session.execute("ANALYZE")
+        large = {name for name, rows in db.session.execute(
+            "SELECT relname, reltuples FROM pg_class"
+            " WHERE relkind IN ('r', 'p')") if rows >= min_rows}
+        ids = {
+            "venue": db.session.query(db.func.min(Venue.id)).scalar(),
+            "artist": db.session.query(db.func.min(Artist.id)).scalar(),
+            "genre": db.session.query(db.func.min(Genre.id)).scalar(),
+            "area": db.session.query(Venue.state, Venue.city)
+            .order_by(Venue.id).first(),
+        }
+
+        cursor = connection.connection.cursor()
+        for label, probe, allowed in PROBES:
+            with captured_statements() as statements:
+                probe(ids)
+            for statement, parameters in statements:
+                cursor.execute("EXPLAIN (FORMAT JSON) " + statement,
+                               parameters)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                for relation in seq_scans(plan[0]["Plan"]):
+                    if relation in large and relation not in allowed:
+                        failures.append((label, relation, statement))
+    finally:
+        db.session.remove()
+        transaction.rollback()
+        connection.close()
+
+    return failures
@@ -0,0 +1,118 @@
+import random
+import threading
+import time
+from functools import wraps
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, event, orm
+from sqlalchemy.sql.dml import UpdateBase
+
+# ----------------------------------------------------------------------------#
+# Read replica routing.
+# ----------------------------------------------------------------------------#
+
+# Set on the response to a request that committed a write; until the time it
+# holds, the client's reads go to the primary.
+STICKY_COOKIE = "db_primary_until"
+
+
+class RoutingSession(SignallingSession):
+    """Session that runs the queries of @replica_reads views on a replica.
+
+    Every other query, and any flush or INSERT, UPDATE or DELETE even from
+    such a view, goes to the primary. Sessions remember that they wrote, so
+    that the client can be kept on the primary after the commit.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info["wrote"] = True
+        elif has_request_context() and g.get("db_replica") is not None:
+            return g.db_replica
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        factory = orm.sessionmaker(class_=RoutingSession, db=self, **options)
+        event.listen(factory, "after_commit", remember_write)
+        event.listen(factory, "after_rollback", forget_write)
+        return factory
+
+
+class ReadReplicas:
+    """Engines for the replicas in SQLALCHEMY_REPLICA_URIS.
+
+    They are created on first use with the primary's engine options, and
+    one of them is picked at random for each request to a @replica_reads
+    view. A client whose request committed a write is served from the
+    primary for the following DB_REPLICA_STICKY_SECONDS, so that it reads
+    its own writes, e.g. on the redirect after an edit, despite replication
+    lag.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault("SQLALCHEMY_REPLICA_URIS", [])
+        app.config.setdefault("DB_REPLICA_STICKY_SECONDS", 10)
+        app.extensions["read_replicas"] = None
+        app.after_request(self._stick_to_primary)
+
+    def engines(self):
+        app = current_app._get_current_object()
+        with self._lock:
+            engines = app.extensions["read_replicas"]
+            if engines is None:
+                options = app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {}
+                engines = app.extensions["read_replicas"] = [
+                    create_engine(uri, **options)
+                    for uri in app.config["SQLALCHEMY_REPLICA_URIS"]]
+        return engines
+
+    def choose(self):
+        """Return the replica engine to read from in this request, or None
+        to read from the primary."""
+        engines = self.engines()
+        if not engines:
+            return None
+        try:
+            until = float(request.cookies.get(STICKY_COOKIE, 0))
+        except ValueError:
+            until = 0
+        return None if until > time.time() else random.choice(engines)
+
+    def _stick_to_primary(self, response):
+        if g.pop("db_wrote", False) and \
+                current_app.config["SQLALCHEMY_REPLICA_URIS"]:
+            seconds = current_app.config["DB_REPLICA_STICKY_SECONDS"]
+            response.set_cookie(STICKY_COOKIE, str(time.time() + seconds),
+                                max_age=seconds, httponly=True,
+                                samesite="Lax")
+        return response
+
+
+read_replicas = ReadReplicas()
+
+
+def replica_reads(view):
+    """Run the queries of a read-only view on a replica."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_replica = read_replicas.choose()
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def reading_from_replica():
+    return has_request_context() and g.get("db_replica") is not None
+
+
+def remember_write(session):
+    if session.info.pop("wrote", False) and has_request_context():
+        g.db_wrote = True
+
+
+def forget_write(session):
+    session.info.pop("wrote", None)
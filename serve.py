@@ -0,0 +1,32 @@
+"""Cooperative serving mode.
+
+The default deployment runs synchronous WSGI workers, where a request holds
+its worker for as long as it waits on Postgres. This module serves the same
+application from gevent workers instead: the standard library is patched to
+yield on I/O and psycogreen makes psycopg2 wait on its socket through gevent,
+so a worker keeps accepting and rendering requests while the others wait on
+the database. The connection pool still bounds how many of them query at
+once; the rest queue for a connection for up to DB_POOL_TIMEOUT seconds.
+
+    $ gunicorn --worker-class gevent --workers 4 \\
+        --worker-connections 1000 serve:application
+
+or, for a single process, `python serve.py`.
+"""
+from gevent import monkey
+monkey.patch_all()
+
+from psycogreen.gevent import patch_psycopg  # noqa: E402
+patch_psycopg()
+
+from app import create_app  # noqa: E402
+
+application = create_app()
+
+
+if __name__ == '__main__':
+    import os
+    from gevent.pywsgi import WSGIServer
+
+    port = int(os.environ.get('PORT', 5000))
+    WSGIServer(('', port), application).serve_forever()